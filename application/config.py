@@ -31,9 +31,43 @@ class BaseConfig():
 
     BOOTSTRAP_SERVE_LOCAL = True
     USE_CACHE = True
+    # Hosts written per bulk write during imports
+    IMPORT_BATCH_SIZE = 500
+    # Hosts fetched per cursor batch when iterating over all hosts
+    HOST_QUERY_BATCH_SIZE = 200
 
 
     DISABLE_SSL_ERRORS = True
+
+    # Checkmk API Connections
+    CMK_CONNECT_TIMEOUT = 10
+    CMK_READ_TIMEOUT = 300
+    CMK_REQUEST_RETRIES = 3
+    CMK_REQUEST_BACKOFF = 0.5
+    CMK_POOL_SIZE = 20
+    # Hosts per bulk-create/update/delete request, 0 disables the bulk endpoints
+    CMK_BULK_SIZE = 50
+    # Send If-Match: * instead of reading the ETag of a host before changing it.
+    # Only enable if the Checkmk version accepts the wildcard
+    CMK_ETAG_WILDCARD = False
+    # Up to this number of changed hosts, they are read one by one from Checkmk
+    # instead of reading all hosts
+    CMK_FINGERPRINT_FETCH_LIMIT = 200
+    # Hours until the host export compares all hosts with Checkmk again,
+    # to revert changes made there and delete hosts removed from the Database
+    CMK_HOST_FULL_COMPARE_AGE = 24
+    # Parallel API calls of the Checkmk configuration exports (rules, BI)
+    CMK_CONFIG_WORKERS = 8
+    # Hours until the BI export reads all rules and aggregations from Checkmk again,
+    # to revert changes made there directly
+    CMK_BI_FULL_COMPARE_AGE = 24
+    # Hours until the Attribute Catalog of the group export is built from all hosts again
+    CMK_CATALOG_MAX_AGE = 24
+
+    # Rule Templates: Path for the compiled Templates on disk, False to disable
+    TEMPLATE_BYTECODE_CACHE = False
+    # Rule Templates: Rendered Outputs kept in memory
+    TEMPLATE_RENDER_CACHE_SIZE = 10000
     SWAGGER_ENABLED = True
     DEBUG = True
     MONGODB_SETTINGS = {
@@ -0,0 +1,101 @@
+"""
+Shared Jinja Environment for the Templates of Rules
+"""
+import jinja2
+from jinja2 import meta
+from application import app
+
+
+class _SourceLoader(jinja2.BaseLoader):
+    """
+    The Name of the Template is its Source,
+    so the Bytecode Cache can be used for Templates from the Database
+    """
+    def get_source(self, environment, template): #pylint: disable=unused-argument
+        """
+        Return the Source, it never gets outdated
+        """
+        return template, None, lambda: True
+
+
+_environment = None #pylint: disable=invalid-name
+# Compiled Templates and the Variables they use, by Source
+_templates = {}
+# Rendered Output, by Source and the Values of the used Variables
+_rendered = {}
+# Marks Variables not in the Context, they render different from None
+_MISSING = object()
+_stats = {
+    'compile_hits': 0,
+    'compile_misses': 0,
+    'render_hits': 0,
+    'render_misses': 0,
+}
+
+
+def get_environment():
+    """
+    Return the shared Environment.
+    With TEMPLATE_BYTECODE_CACHE set to a Path, compiled Templates are kept on disk.
+    """
+    global _environment #pylint: disable=global-statement, invalid-name
+    if not _environment:
+        bytecode_cache = None
+        if cache_path := app.config.get('TEMPLATE_BYTECODE_CACHE'):
+            bytecode_cache = jinja2.FileSystemBytecodeCache(cache_path)
+        # We keep the Templates ourselves
+        _environment = jinja2.Environment(loader=_SourceLoader(), cache_size=0,
+                                          bytecode_cache=bytecode_cache)
+    return _environment
+
+
+def get_template(source):
+    """
+    Return the compiled Template and the Names of its Variables
+    """
+    if source in _templates:
+        _stats['compile_hits'] += 1
+        return _templates[source]
+    _stats['compile_misses'] += 1
+    environment = get_environment()
+    variables = meta.find_undeclared_variables(environment.parse(source))
+    _templates[source] = environment.get_template(source), sorted(variables)
+    return _templates[source]
+
+
+def render_template(source, **context):
+    """
+    Render the Template Source.
+    The Output is reused if the Variables used by the Template have the same Values.
+    """
+    template, variables = get_template(source)
+    try:
+        # With the Type, since 1, 1.0 and True are equal but render different
+        values = (context.get(x, _MISSING) for x in variables)
+        key = (source, tuple((type(x), x) for x in values))
+        hash(key)
+    except TypeError:
+        # Not hashable values like lists
+        _stats['render_misses'] += 1
+        return template.render(**context)
+    if key in _rendered:
+        _stats['render_hits'] += 1
+        return _rendered[key]
+    _stats['render_misses'] += 1
+    if len(_rendered) >= app.config.get('TEMPLATE_RENDER_CACHE_SIZE', 10000):
+        _rendered.clear()
+    _rendered[key] = template.render(**context)
+    return _rendered[key]
+
+
+def template_cache_info():
+    """
+    Return Hit Ratios of the Template Caches as String
+    """
+    lines = []
+    for name in ['compile', 'render']:
+        hits = _stats[f'{name}_hits']
+        total = hits + _stats[f'{name}_misses']
+        ratio = 100.0 * hits / total if total else 0
+        lines.append(f"{name}: {hits}/{total} hits ({ratio:.0f}%)")
+    return ", ".join(lines)
@@ -62,5 +62,8 @@ class CronStats(db.Document):
 
 
     meta = {
-        'strict' : False
+        'strict' : False,
+        'indexes': [
+            'group',
+        ],
     }
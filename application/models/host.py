@@ -38,6 +38,8 @@ class Host(db.Document):
     last_import_seen = db.DateTimeField()
     last_import_sync = db.DateTimeField()
     last_export = db.DateTimeField()
+    # Last change of labels or inventory
+    last_change = db.DateTimeField()
 
 
     raw = db.StringField()
@@ -51,11 +53,73 @@ class Host(db.Document):
 
     cache = db.DictField()
 
+    # Hash of the last export, per target account id
+    export_fingerprints = db.DictField()
+
 
     meta = {
         'strict': False,
+        'indexes': [
+            # Exports, and Imports which query their own hosts
+            ('available', 'source_account_id'),
+            'source_account_id',
+            # Maintenance
+            'last_import_seen',
+            # Attribute Catalog
+            'last_change',
+            # Folder Pools
+            {'fields': ['folder'], 'sparse': True},
+        ],
     }
 
+    # Indexes MongoEngine can not declare in meta.
+    # They are created with: ./cmdbsyncer sys ensure_indexes
+    extra_indexes = [
+        # Host View: Filter for Label Key
+        {'keys': [('labels.$**', 1)], 'name': 'labels_wildcard'},
+    ]
+
+
+    @staticmethod
+    def iter_hosts(only=None, exclude=None, batch_size=None, paged=False, **filters):
+        """
+        Iterate over Hosts without keeping them in memory.
+        Get totals for progress output with Host.objects(**filters).count()
+
+        Args:
+            only (list): Load only these fields
+            exclude (list): Don't load these fields, e.g. raw and log
+            batch_size (int): Hosts per cursor batch, default is HOST_QUERY_BATCH_SIZE
+            paged (bool): Read one batch after the other by _id, without an open cursor.
+                          Use it if every Host takes long, like with API calls,
+                          since MongoDB closes idle cursors after 10 minutes.
+            filters: Query, e.g. available=True
+        """
+        batch_size = batch_size or app.config.get('HOST_QUERY_BATCH_SIZE', 200)
+        query = Host.objects(**filters).no_cache()
+        if only:
+            query = query.only(*only)
+        if exclude:
+            query = query.exclude(*exclude)
+        if paged:
+            return Host._iter_pages(query, batch_size)
+        return query.batch_size(batch_size)
+
+    @staticmethod
+    def _iter_pages(query, page_size):
+        """
+        Yield the Hosts of the query, one page after the other ordered by _id
+        """
+        last_id = None
+        while True:
+            page_query = query.clone().order_by('id')
+            if last_id:
+                page_query = page_query.filter(id__gt=last_id)
+            page = list(page_query.limit(page_size))
+            if not page:
+                return
+            yield from page
+            last_id = page[-1].id
 
     @staticmethod
     def get_host(hostname, create=True):
@@ -77,6 +141,20 @@ class Host(db.Document):
             return new_host
         return False
 
+    def _update_fields(self, update):
+        """
+        Send the given update operation only for this Host,
+        instead of saving the whole Document.
+        Not yet saved Hosts are saved completely.
+
+        Args:
+            update (dict): MongoDB Update Operation
+        """
+        if not self.pk:
+            self.save()
+            return
+        Host._get_collection().update_one({'_id': self.pk}, update)
+
     def lock_to_folder(self, folder_name):
         """
         Lock System to given Folder
@@ -84,9 +162,10 @@ class Host(db.Document):
         """
         if not folder_name:
             self.folder = None
+            self._update_fields({'$unset': {'folder': ""}})
         else:
             self.folder = folder_name
-        self.save()
+            self._update_fields({'$set': {'folder': folder_name}})
 
     def get_folder(self):
         """ Returns Folder if System is locked to one, else False """
@@ -102,6 +181,8 @@ class Host(db.Document):
             key (string): Label Name
             value (string): Label Value
         """
+        if key not in self.labels or self.labels[key] != value:
+            self.last_change = datetime.datetime.now()
         hit = False
         for label in self.labels:
             if label == key:
@@ -118,6 +199,8 @@ class Host(db.Document):
         Args:
             label_dict (dict): Key:Value pairs of labels
         """
+        if label_dict != self.labels:
+            self.last_change = datetime.datetime.now()
         self.labels=label_dict
         self.cache = {}
 
@@ -140,12 +223,16 @@ class Host(db.Document):
            new_data (dict): Key:Value of Attributes.
         """
         # pylint: disable=unnecessary-comprehension
+        new_entries = {f"{key}_{x}":y for x, y in new_data.items()}
+        old_entries = {x: y for x, y in self.inventory.items() if x.startswith(key)}
+        if new_entries != old_entries:
+            self.last_change = datetime.datetime.now()
         # Prevent runtime error
         for name in [x for x in self.inventory.keys()]:
             # Delete all existing keys of type
             if name.startswith(key):
                 del self.inventory[name]
-        self.inventory.update({f"{key}_{x}":y for x, y in new_data.items()})
+        self.inventory.update(new_entries)
         self.cache = {}
 
     def get_inventory(self, key_filter=False):
@@ -161,6 +248,47 @@ class Host(db.Document):
 
         return self.inventory
 
+    def get_cache_entry(self, group, key, version):
+        """
+        Return cached content, or None if there is nothing cached,
+        the content was built with other rules or caching is disabled.
+
+        Args:
+            group (string): Cache Group, normally the name of the plugin
+            key (string): Name of the entry
+            version (string): Version of the rules the content depends on
+        """
+        if not app.config['USE_CACHE']:
+            return None
+        entry = self.cache.get(group, {}).get(key)
+        if not isinstance(entry, dict) or entry.get('version') != version:
+            return None
+        return entry.get('content')
+
+    def set_cache_entry(self, group, key, content, version):
+        """
+        Store content in the cache, stamped with the version of the rules
+        it was built with. Entries with other versions are ignored later on,
+        so changing rules does not require to delete the cache.
+
+        Args:
+            group (string): Cache Group, normally the name of the plugin
+            key (string): Name of the entry
+            content (dict): Content to cache
+            version (string): Version of the rules the content depends on
+
+        The entry is written directly to the Database.
+        """
+        if not app.config['USE_CACHE']:
+            return
+        entry = {
+            'version': version,
+            'content': content,
+        }
+        self.cache.setdefault(group, {})
+        self.cache[group][key] = entry
+        self._update_fields({'$set': {f'cache.{group}.{key}': entry}})
+
     def add_log(self, entry):
         """
         Add Log Entry to Host log.
@@ -245,12 +373,23 @@ class Host(db.Document):
         self.available = False
         self.add_log("Not found on Source anymore")
 
+    @staticmethod
+    def touch_export(hostnames):
+        """
+        Mark that the Hosts were updated on export.
+        Only last_export is written, with one Query for all Hosts.
+
+        Args:
+            hostnames (list): Names of the exported Hosts
+        """
+        Host.objects(hostname__in=hostnames).update(set__last_export=datetime.datetime.now())
+
     def set_export_sync(self):
         """
         Mark that the host was updated on export
         """
         self.last_export = datetime.datetime.now()
-        self.save()
+        self._update_fields({'$set': {'last_export': self.last_export}})
 
     def need_import_sync(self, hours=24):
         """
@@ -281,7 +420,7 @@ class Host(db.Document):
             return True
         if self.force_update:
             self.force_update = False
-            self.save()
+            self._update_fields({'$set': {'force_update': False}})
             return True
         timediff = datetime.datetime.now() - self.last_export
         if divmod(timediff.total_seconds(), 3600)[0] > hours:
@@ -37,18 +37,22 @@ class SyncAnsible(Plugin):
         Return extra Attributes based on
         rules which has existing attributes in condition
         """
-        if db_host.cache.get('ansible',{}).get('outcomes'):
-            return db_host.cache['ansible']['outcomes']
+        # Outcomes depend on the Attributes and the Ansible Rules
+        version = f"{self.get_attributes_version()}:{self.actions.version}"
+        cached = db_host.get_cache_entry('ansible', 'outcomes', version)
+        if cached is not None:
+            return cached
         outcomes = self.actions.get_outcomes(db_host, attributes)
-        db_host.cache.setdefault('ansible', {})
-        db_host.cache['ansible']['outcomes'] = outcomes
-        db_host.save()
+        db_host.set_cache_entry('ansible', 'outcomes', outcomes, version)
         return outcomes
 
 
-    def get_full_inventory(self):
+    def get_full_inventory(self, limit=None):
         """
         Get Full Inventory Information for Ansible
+
+        Args:
+            limit (list): Only include these Hosts
         """
         data = {
             '_meta': {
@@ -59,7 +63,10 @@ class SyncAnsible(Plugin):
             },
         }
         #pylint: disable=no-member
-        for db_host in Host.objects(available=True):
+        filters = {'available': True}
+        if limit:
+            filters['hostname__in'] = limit
+        for db_host in Host.iter_hosts(exclude=['raw', 'log'], **filters):
             hostname = db_host.hostname
 
             attributes = self.get_host_attributes(db_host, 'ansible')
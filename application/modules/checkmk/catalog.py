@@ -0,0 +1,143 @@
+"""
+Catalog of all Host Attributes
+"""
+#pylint: disable=no-member
+import datetime
+from mongoengine.errors import DoesNotExist
+from application import app
+from application.models.host import Host
+from application.modules.checkmk.models import CheckmkObjectCache
+from application.modules.debug import ColorCodes as CC
+
+
+class AttributeCatalog(): #pylint: disable=too-many-instance-attributes
+    """
+    All Keys and Values of the Host Attributes, built in one pass.
+    The Catalog is stored in the CheckmkObjectCache, one Document per Key,
+    so no Document grows over the Size Limit of MongoDB. A further Document
+    keeps the Version of the Rules and a Watermark. Later, only Hosts changed
+    since the Watermark are read again.
+    A full Build is done if the Rules changed, or after CMK_CATALOG_MAX_AGE hours,
+    since Values of changed or deleted Hosts are only removed then.
+
+    Example:
+        catalog = AttributeCatalog(syncer, 'cmk_conf').load()
+        catalog.keys['os'] # Values of os
+        catalog.values['linux'] # Keys with linux as Value
+    """
+
+    def __init__(self, syncer, cache, account=None, field='all'):
+        """
+        Args:
+            syncer (Plugin): Plugin with the Rules, for get_host_attributes()
+            cache (string): Cache Name of get_host_attributes()
+            account (Account): Account of the Catalog, if Rules depend on it
+            field (string): Use 'all' or only 'filtered' Attributes
+        """
+        self.syncer = syncer
+        self.cache = cache
+        self.account = account
+        self.field = field
+        self.cache_group = f"attribute_catalog_{cache}_{field}"
+        # Dicts as ordered Sets
+        self.keys = {}
+        self.values = {}
+        # Keys with new Values, to be stored
+        self.changed = set()
+
+    def add(self, key, value):
+        """
+        Add an Attribute
+        """
+        try:
+            hash(value)
+        except TypeError:
+            value = str(value)
+        values = self.keys.setdefault(key, {})
+        if value not in values:
+            values[value] = True
+            self.changed.add(key)
+        self.values.setdefault(value, {})[key] = True
+
+    def get_key_objects(self):
+        """
+        Query for the stored Keys of the Catalog
+        """
+        return CheckmkObjectCache.objects(cache_group=f"{self.cache_group}_keys",
+                                          account=self.account)
+
+    def get_cache_object(self):
+        """
+        Get the stored State of the Catalog
+        """
+        try:
+            return CheckmkObjectCache.objects.get(cache_group=self.cache_group,
+                                                  account=self.account)
+        except DoesNotExist:
+            new = CheckmkObjectCache()
+            new.cache_group = self.cache_group
+            new.account = self.account
+            return new
+
+    def load(self):
+        """
+        Load the Catalog and read the Hosts changed since the last Build
+        """
+        now = datetime.datetime.now()
+        if not self.syncer.custom_attributes:
+            self.syncer.init_custom_attributes()
+        version = self.syncer.get_attributes_version()
+        cache_object = self.get_cache_object()
+        content = cache_object.content
+        max_age = datetime.timedelta(hours=app.config['CMK_CATALOG_MAX_AGE'])
+
+        filters = {'available': True}
+        full = content.get('version') != version or \
+                content.get('full_build', now) <= now - max_age
+        if not full:
+            for key_object in self.get_key_objects():
+                for value in key_object.content['values']:
+                    self.add(key_object.content['key'], value)
+            self.changed = set()
+            filters['last_change__gte'] = content['watermark']
+            full_build = content['full_build']
+            print(f"{CC.OKGREEN} -- {CC.ENDC} Attribute Catalog: "\
+                  f"read {Host.objects(**filters).count()} changed hosts")
+        else:
+            full_build = now
+            print(f"{CC.OKGREEN} -- {CC.ENDC} Attribute Catalog: read all hosts")
+
+        for db_host in Host.iter_hosts(exclude=['raw', 'log'], **filters):
+            if attributes := self.syncer.get_host_attributes(db_host, self.cache):
+                for key, value in attributes[self.field].items():
+                    self.add(key, value)
+
+        self.save_keys(full)
+        cache_object.content = {
+            'version': version,
+            # Changes while we read are found next time
+            'watermark': now,
+            'full_build': full_build,
+        }
+        cache_object.save()
+        return self
+
+    def save_keys(self, full):
+        """
+        Store the Keys with new Values, or all of them after a full Build
+        """
+        if full:
+            self.get_key_objects().delete()
+            new_objects = []
+            for key, values in self.keys.items():
+                new = CheckmkObjectCache()
+                new.cache_group = f"{self.cache_group}_keys"
+                new.account = self.account
+                new.content = {'key': key, 'values': list(values)}
+                new_objects.append(new)
+            if new_objects:
+                CheckmkObjectCache.objects.insert(new_objects)
+            return
+        for key in self.changed:
+            self.get_key_objects().filter(content__key=key).update_one(
+                set__content__values=list(self.keys[key]), upsert=True)
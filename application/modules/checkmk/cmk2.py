@@ -1,7 +1,12 @@
 """
 Central Request Modul to CMK 2.x
 """
+import codecs
+import json
+import time
+import threading
 import requests
+from requests.adapters import HTTPAdapter, Retry
 from application import app, log, logger
 from application.modules.plugin import Plugin
 
@@ -17,6 +22,124 @@ if app.config.get("DISABLE_SSL_ERRORS"):
 class CmkException(Exception):
     """Cmk Errors"""
 
+
+# Bytes read per chunk when streaming collections
+STREAM_CHUNK_SIZE = 64 * 1024
+
+class _StreamReader():
+    """
+    Read JSON Values from a stream of chunks,
+    keeping only the not yet parsed part in memory
+    """
+    decoder = json.JSONDecoder()
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        """Read next chunk"""
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            return
+        if isinstance(chunk, bytes):
+            chunk = self.text_decoder.decode(chunk)
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Return next not whitespace char"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                raise ValueError("Unexpected end of JSON")
+            self._fill()
+
+    def take(self, char):
+        """Consume the given char"""
+        if self.peek() != char:
+            raise ValueError(f"Expected '{char}' in JSON, got '{self.buf[self.pos]}'")
+        self.pos += 1
+
+    def value(self):
+        """Parse the next complete value"""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+                # A number could go on in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iter_json_array(chunks, key='value'):
+    """
+    Yield the entries of the Array under key of a JSON Object,
+    while the chunks are read. Only one entry is in memory at a time.
+    """
+    reader = _StreamReader(chunks)
+    reader.take('{')
+    while reader.peek() != '}':
+        name = reader.value()
+        reader.take(':')
+        if name != key:
+            reader.value()
+        else:
+            reader.take('[')
+            while reader.peek() != ']':
+                yield reader.value()
+                if reader.peek() == ',':
+                    reader.take(',')
+            # We don't care about the rest
+            return
+        if reader.peek() == ',':
+            reader.take(',')
+
+
+# One Session per Checkmk Account, shared by all Syncers of the process
+_sessions = {}
+_stats_lock = threading.Lock()
+
+def get_session(config):
+    """
+    Return pooled Session for the given Account.
+    Connections are kept alive and failed requests retried with backoff.
+    """
+    key = (config['address'], config['username'])
+    if key not in _sessions:
+        retry = Retry(
+            total=app.config['CMK_REQUEST_RETRIES'],
+            backoff_factor=app.config['CMK_REQUEST_BACKOFF'],
+            status_forcelist=[429, 500, 502, 503, 504],
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=app.config['CMK_POOL_SIZE'],
+            pool_maxsize=app.config['CMK_POOL_SIZE'],
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+        _sessions[key] = session
+    return _sessions[key]
+
 #pylint: disable=too-few-public-methods
 class CMK2(Plugin):
     """
@@ -30,10 +153,33 @@ class CMK2(Plugin):
         self.log = log
         self.verify = not app.config.get('DISABLE_SSL_ERRORS')
         self.config = {}
+        self.request_stats = {}
 
-    def request(self, params, method='GET', data=None, additional_header=None):
+    def _track_request(self, method, duration):
         """
-        Handle Request to CMK
+        Record Latency of a Request
+        """
+        with _stats_lock:
+            stats = self.request_stats.setdefault(method,
+                                                  {'count': 0, 'total': 0.0, 'max': 0.0})
+            stats['count'] += 1
+            stats['total'] += duration
+            stats['max'] = max(stats['max'], duration)
+
+    def get_request_summary(self):
+        """
+        Return Request Count and Latency per Method as String
+        """
+        lines = []
+        for method, stats in self.request_stats.items():
+            average = stats['total'] / stats['count']
+            lines.append(f"{method}: {stats['count']} requests, "\
+                         f"avg {average*1000:.0f}ms, max {stats['max']*1000:.0f}ms")
+        return ", ".join(lines)
+
+    def _prepare_request(self, params, additional_header=None):
+        """
+        Return URL and Headers for a Request
         """
         address = self.config['address']
         username = self.config['username']
@@ -42,29 +188,64 @@ class CMK2(Plugin):
         headers = {
             'Authorization': f"Bearer {username} {password}"
         }
-        response = False
         if additional_header:
             headers.update(additional_header)
+        return url, headers
+
+    def request_collection(self, params, data=None):
+        """
+        Yield the entries of a Collection while they are read from Checkmk.
+        Use it instead of request() for big Collections like all Hosts,
+        and keep only the fields needed from every entry.
+        """
+        url, headers = self._prepare_request(params)
+        session = get_session(self.config)
+        timeout = (app.config['CMK_CONNECT_TIMEOUT'], app.config['CMK_READ_TIMEOUT'])
+        logger.debug(f"Stream Request (GET) to {url}")
+        start = time.time()
+        with session.get(url, headers=headers, params=data, verify=self.verify,
+                         timeout=timeout, stream=True) as response:
+            if response.status_code != 200:
+                response_json = response.json()
+                raise CmkException(f"{response_json['title']} {response_json.get('detail')}")
+            yield from iter_json_array(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+        self._track_request('GET', time.time() - start)
+
+    def request(self, params, method='GET', data=None, additional_header=None):
+        """
+        Handle Request to CMK
+        """
+        url, headers = self._prepare_request(params, additional_header)
+        response = False
+        session = get_session(self.config)
+        timeout = (app.config['CMK_CONNECT_TIMEOUT'], app.config['CMK_READ_TIMEOUT'])
         try:
             method = method.lower()
-            #pylint: disable=missing-timeout
             logger.debug(f"Request ({method.upper()}) to {url}")
             logger.debug(f"Request Body: {data}")
+            start = time.time()
             if method == 'get':
-                response = requests.get(url,
-                                        headers=headers,
-                                        params=data,
-                                        verify=self.verify,
-                                       )
+                response = session.get(url,
+                                       headers=headers,
+                                       params=data,
+                                       verify=self.verify,
+                                       timeout=timeout,
+                                      )
             elif method == 'post':
-                response = requests.post(url, json=data, headers=headers, verify=self.verify)
+                response = session.post(url, json=data, headers=headers,
+                                        verify=self.verify, timeout=timeout)
             elif method == 'put':
-                response = requests.put(url, json=data, headers=headers, verify=self.verify)
+                response = session.put(url, json=data, headers=headers,
+                                       verify=self.verify, timeout=timeout)
             elif method == 'delete':
-                response = requests.delete(url, headers=headers, verify=self.verify)
+                response = session.delete(url, headers=headers,
+                                          verify=self.verify, timeout=timeout)
+                self._track_request(method.upper(), time.time() - start)
                 # Checkmk gives no json response here, so we directly return
                 return True, response.status_code
-
+            duration = time.time() - start
+            self._track_request(method.upper(), duration)
+            logger.debug(f"Request took {duration*1000:.0f}ms")
 
             #pylint: disable=line-too-long
             error_whitelist = [
@@ -75,6 +256,9 @@ class CMK2(Plugin):
                 'Precondition required If-Match header required for this operation. See documentation.',
             ]
 
+            if response.status_code == 204:
+                # No Content, like for bulk-delete
+                return {}, {'status_code': response.status_code}
             if response.status_code != 200:
                 response_json = response.json()
                 logger.debug(f"Response Json {response_json}")
@@ -3,13 +3,20 @@ Checkmk Configuration
 """
 #pylint: disable=import-error, too-many-locals, too-many-branches, too-many-statements, no-member
 import ast
-import jinja2
+import datetime
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from mongoengine.errors import DoesNotExist
-from application import log
+from application import app, log
 from application.modules.checkmk.cmk2 import CMK2, CmkException
 from application.modules.checkmk.models import CheckmkGroupRule, CheckmkObjectCache
+from application.modules.checkmk.catalog import AttributeCatalog
 from application.modules.debug import ColorCodes as CC
 from application.models.host import Host
+from application.helpers.templates import render_template, template_cache_info
+from application.modules.rule.match import needle_cache_info
 
 replacers = [
   (' ', '_'),
@@ -29,6 +36,8 @@ class SyncConfiguration(CMK2):
     """
     Sync jobs for Checkmk Config
     """
+    # Parsed Rule Values, by their String
+    value_keys = {}
 
     @staticmethod
     def replace(input_raw):
@@ -40,6 +49,34 @@ class SyncConfiguration(CMK2):
             input_str = input_str.replace(needle, replacer)
         return input_str.strip()
 
+    @staticmethod
+    def make_hashable(obj):
+        """
+        Return a hashable Version of obj, equal if obj is equal
+        """
+        if isinstance(obj, dict):
+            return ('dict', tuple(sorted(((repr(k), SyncConfiguration.make_hashable(v)) \
+                                            for k, v in obj.items()))))
+        if isinstance(obj, list):
+            return ('list', tuple(SyncConfiguration.make_hashable(x) for x in obj))
+        if isinstance(obj, tuple):
+            return ('tuple', tuple(SyncConfiguration.make_hashable(x) for x in obj))
+        if isinstance(obj, set):
+            return frozenset(SyncConfiguration.make_hashable(x) for x in obj)
+        return obj
+
+    def get_value_key(self, value):
+        """
+        Parse the Python Value of a Rule once and return its hashable Version
+        """
+        if value not in self.value_keys:
+            try:
+                parsed = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                parsed = value.strip()
+            self.value_keys[value] = self.make_hashable(parsed)
+        return self.value_keys[value]
+
     def get_cache_object(self, group):
         """
         Get Cache Objects
@@ -54,26 +91,66 @@ class SyncConfiguration(CMK2):
 
     def parse_attributes(self):
         """
-        Create dict with list of all possible attributes
-        """
-        collection_keys = {}
-        collection_values = {}
-        for db_host in Host.objects(available=True):
-            if attributes := self.get_host_attributes(db_host, 'cmk_conf'):
-                for key, value in attributes['all'].items():
-                    # Add the Keys
-                    collection_keys.setdefault(key, [])
-                    if value not in collection_keys[key]:
-                        collection_keys[key].append(value)
-                    # Add the Values
-                    collection_values.setdefault(value, [])
-                    if key not in collection_values[value]:
-                        collection_values[value].append(key)
+        Return all Keys with their Values, and all Values with their Keys
+        """
+        catalog = AttributeCatalog(self, 'cmk_conf', account=self.account).load()
         # [0] All Values behind Label
         # [1] All Keys which have value
-        return collection_keys, collection_values
+        return catalog.keys, catalog.values
 
 #   .-- Export Rulesets
+    def get_ruleset_rules(self, ruleset_name):
+        """
+        Read the Rules of a Ruleset from Checkmk,
+        returns them with the Name and the Duration
+        """
+        start = time.time()
+        url = f"domain-types/rule/collections/all?ruleset_name={ruleset_name}"
+        rule_response = self.request(url, method="GET")[0]
+        return ruleset_name, rule_response.get('value', []), time.time() - start
+
+    def delete_rule(self, entry):
+        """
+        Delete a Rule in Checkmk
+        """
+        _ruleset_name, rule_id = entry
+        url = f'/objects/rule/{rule_id}'
+        self.request(url, method="DELETE")
+        return entry
+
+    def create_rule(self, entry):
+        """
+        Create a Rule in Checkmk,
+        returns Ruleset, Rule and the Error if it failed
+        """
+        ruleset_name, rule = entry
+        template = {
+            "ruleset": f"{ruleset_name}",
+            "folder": rule['folder'],
+            "properties": {
+                "disabled": False,
+                "description": f"cmdbsyncer_{self.account_id}",
+                "comment": rule['comment'],
+            },
+            'conditions' : rule['condition'],
+            "value_raw": rule['value'],
+        }
+        url = "domain-types/rule/collections/all"
+        try:
+            self.request(url, data=template, method="POST")
+        except CmkException as error:
+            return ruleset_name, rule, error
+        return ruleset_name, rule, None
+
+    def create_ruleset_rules(self, entry):
+        """
+        Create the Rules of one Ruleset one after the other,
+        since Checkmk appends them and the order matters.
+        Returns the Results of create_rule()
+        """
+        ruleset_name, rules = entry
+        return [self.create_rule((ruleset_name, rule)) for rule in rules]
+
     def export_cmk_rules(self):
         """
         Export config rules to checkmk
@@ -82,9 +159,11 @@ class SyncConfiguration(CMK2):
         print(f"\n{CC.HEADER}Build needed Rules{CC.ENDC}")
         print(f"{CC.OKGREEN} -- {CC.ENDC} Loop over Hosts and collect distinct rules")
 
+        # Rules per Ruleset, by (folder, condition, value) Key
         rulsets_by_type = {}
+        self.value_keys = {}
 
-        for db_host in Host.objects(available=True):
+        for db_host in Host.iter_hosts(exclude=['raw', 'log'], available=True):
             attributes = self.get_host_attributes(db_host, 'cmk_conf')
             if not attributes:
                 continue
@@ -94,16 +173,13 @@ class SyncConfiguration(CMK2):
                     for rule_params in rules:
                         # Render Template Value
                         condition_tpl = {"host_tags": [], "service_labels": []}
-                        value_tpl = jinja2.Template(rule_params['value_template'])
-                        value = \
-                            value_tpl.render(HOSTNAME=db_host.hostname, **attributes['all'])
+                        value = render_template(rule_params['value_template'],
+                                                HOSTNAME=db_host.hostname, **attributes['all'])
 
                         if rule_params['condition_label_template']:
-                            label_condition_tpl = \
-                                jinja2.Template(rule_params['condition_label_template'])
                             label_condition = \
-                                label_condition_tpl.render(HOSTNAME=db_host.hostname, \
-                                                                **attributes['all'])
+                                render_template(rule_params['condition_label_template'],
+                                                HOSTNAME=db_host.hostname, **attributes['all'])
 
                             label_key, label_value = label_condition.split(':')
                             # Fix bug in case of empty Labels in store
@@ -117,12 +193,9 @@ class SyncConfiguration(CMK2):
                         del rule_params['condition_label_template']
 
                         if rule_params['condition_host']:
-                            host_condition_tpl = \
-                                jinja2.Template(rule_params['condition_host'])
-
                             host_condition = \
-                                host_condition_tpl.render(HOSTNAME=db_host.hostname, \
-                                                                **attributes['all'])
+                                render_template(rule_params['condition_host'],
+                                                HOSTNAME=db_host.hostname, **attributes['all'])
                             if host_condition:
                                 condition_tpl["host_name"]= {
                                                 "match_on": host_condition.split(','),
@@ -137,64 +210,88 @@ class SyncConfiguration(CMK2):
 
                         rule_params['condition'] = condition_tpl
 
-                        rulsets_by_type.setdefault(rule_type, [])
-                        if rule_params not in rulsets_by_type[rule_type]:
-                            rulsets_by_type[rule_type].append(rule_params)
+                        rule_key = (rule_params['folder'],
+                                    self.make_hashable(condition_tpl),
+                                    self.get_value_key(value))
+                        rulsets_by_type.setdefault(rule_type, {})
+                        if rule_key not in rulsets_by_type[rule_type]:
+                            rulsets_by_type[rule_type][rule_key] = rule_params
 
         print(f"{CC.OKGREEN} -- {CC.ENDC} Clean existing CMK configuration")
-        for ruleset_name, rules in rulsets_by_type.items():
-            url = f"domain-types/rule/collections/all?ruleset_name={ruleset_name}"
-            rule_response = self.request(url, method="GET")[0]
-            for cmk_rule in rule_response['value']:
-                if cmk_rule['extensions']['properties'].get('description', '') != \
-                    f'cmdbsyncer_{self.account_id}':
-                    continue
-
-
-
-                value = cmk_rule['extensions']['value_raw']
-                cmk_condition = cmk_rule['extensions']['conditions']
-                rule_found = False
-                for rule in rules:
-                    cmk_value = ast.literal_eval(rule['value'])
-                    check_value = ast.literal_eval(value)
-                    if rule['condition'] == cmk_condition and cmk_value == check_value:
-                        rule_found = True
-                        # Remove from list, so that it not will be created in the next step
-                        rulsets_by_type[ruleset_name].remove(rule)
-
-                if not rule_found: # Not existing any more
-                    rule_id = cmk_rule['id']
-                    print(f"{CC.OKBLUE} *{CC.ENDC} DELETE Rule in {ruleset_name} {rule_id}")
-                    url = f'/objects/rule/{rule_id}'
-                    self.request(url, method="DELETE")
-                    messages.append(("INFO", f"Deleted Rule in {ruleset_name} {rule_id}"))
-
-        print(f"{CC.OKGREEN} -- {CC.ENDC} Create new Rules")
-        for ruleset_name, rules in rulsets_by_type.items():
-            for rule in rules:
-                template = {
-                    "ruleset": f"{ruleset_name}",
-                    "folder": rule['folder'],
-                    "properties": {
-                        "disabled": False,
-                        "description": f"cmdbsyncer_{self.account_id}",
-                        "comment": rule['comment'],
-                    },
-                    'conditions' : rule['condition'],
-                    "value_raw": rule['value'],
+        workers = app.config['CMK_CONFIG_WORKERS']
+        stats = {}
+        delete_list = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for ruleset_name, cmk_rules, duration in \
+                    executor.map(self.get_ruleset_rules, list(rulsets_by_type)):
+                rules = rulsets_by_type[ruleset_name]
+                stats[ruleset_name] = {
+                    'duration': duration,
+                    'found': 0,
+                    'kept': 0,
+                    'deleted': 0,
+                    'created': 0,
+                    'failed': 0,
                 }
-
-
-                print(f"{CC.OKBLUE} *{CC.ENDC} Create Rule in {ruleset_name} " \
-                      f"({rule['condition']})")
-                url = "domain-types/rule/collections/all"
-                try:
-                    self.request(url, data=template, method="POST")
-                    messages.append(("INFO", f"Created Rule in {ruleset_name}: {rule['value']}"))
-                except CmkException as error:
-                    print(f"{CC.FAIL} Failue: {error} {CC.ENDC}")
-
+                # Checkmk Rules are matched by condition and value
+                rules_by_match = {}
+                for rule_key in rules:
+                    rules_by_match.setdefault(rule_key[1:], []).append(rule_key)
+
+                for cmk_rule in cmk_rules:
+                    if cmk_rule['extensions']['properties'].get('description', '') != \
+                        f'cmdbsyncer_{self.account_id}':
+                        continue
+                    stats[ruleset_name]['found'] += 1
+
+                    value = cmk_rule['extensions']['value_raw']
+                    cmk_condition = cmk_rule['extensions']['conditions']
+                    match_key = (self.make_hashable(cmk_condition), self.get_value_key(value))
+                    # A second Checkmk Rule with the same match is a duplicate and deleted
+                    rule_found = match_key in rules_by_match
+                    if rule_found:
+                        stats[ruleset_name]['kept'] += 1
+                        # Remove, so that it not will be created in the next step
+                        for rule_key in rules_by_match.pop(match_key):
+                            del rules[rule_key]
+
+                    if not rule_found: # Not existing any more
+                        delete_list.append((ruleset_name, cmk_rule['id']))
+
+            for ruleset_name, rule_id in delete_list:
+                print(f"{CC.OKBLUE} *{CC.ENDC} DELETE Rule in {ruleset_name} {rule_id}")
+            for ruleset_name, rule_id in executor.map(self.delete_rule, delete_list):
+                stats[ruleset_name]['deleted'] += 1
+                messages.append(("INFO", f"Deleted Rule in {ruleset_name} {rule_id}"))
+
+            print(f"{CC.OKGREEN} -- {CC.ENDC} Create new Rules")
+            # Rulesets in parallel, their Rules in order
+            create_list = []
+            for ruleset_name, rules in rulsets_by_type.items():
+                for rule in rules.values():
+                    print(f"{CC.OKBLUE} *{CC.ENDC} Create Rule in {ruleset_name} " \
+                          f"({rule['condition']})")
+                if rules:
+                    create_list.append((ruleset_name, list(rules.values())))
+            for results in executor.map(self.create_ruleset_rules, create_list):
+                for ruleset_name, rule, error in results:
+                    if error:
+                        stats[ruleset_name]['failed'] += 1
+                        print(f"{CC.FAIL} Failue: {error} {CC.ENDC}")
+                        continue
+                    stats[ruleset_name]['created'] += 1
+                    messages.append(("INFO",
+                                     f"Created Rule in {ruleset_name}: {rule['value']}"))
+
+        for ruleset_name, ruleset_stats in stats.items():
+            messages.append(("INFO", f"Ruleset {ruleset_name}: "\
+                             f"read in {ruleset_stats['duration']*1000:.0f}ms, "\
+                             f"{ruleset_stats['found']} found, {ruleset_stats['kept']} kept, "\
+                             f"{ruleset_stats['deleted']} deleted, "\
+                             f"{ruleset_stats['created']} created, "\
+                             f"{ruleset_stats['failed']} failed"))
+        print(f"{CC.OKGREEN} -- {CC.ENDC} Templates: {template_cache_info()}")
+        print(f"{CC.OKGREEN} -- {CC.ENDC} Rule Needles: {needle_cache_info()}")
         log.log(f"Checkmk Rules synced with {self.account_name}", \
                         source="CMK_RULE_SYNC", details=messages)
 #.
@@ -217,11 +314,10 @@ class SyncConfiguration(CMK2):
             rewrite = False
             if outcome.rewrite:
                 rewrite = True
-                rewrite_tpl = jinja2.Template(outcome.rewrite)
             if outcome.foreach_type == 'value':
                 for label_value in attributes[1].get(outcome.foreach, []):
                     if rewrite:
-                        label_value = rewrite_tpl.render(name=label_value)
+                        label_value = render_template(outcome.rewrite, name=label_value)
                     label_value = self.replace(label_value)
                     if label_value and label_value not in groups[group_name]:
                         groups[group_name].append(label_value)
@@ -230,7 +326,7 @@ class SyncConfiguration(CMK2):
                 for label_key in attributes[0].get(outcome.foreach, []):
                     print(f"Checking: {label_key}")
                     if rewrite:
-                        label_key = rewrite_tpl.render(name=label_key)
+                        label_key = render_template(outcome.rewrite, name=label_key)
                     label_key = self.replace(label_key)
                     label_key = label_key.replace(' ', '_').strip()
                     if label_key and label_key not in groups[group_name]:
@@ -314,144 +410,190 @@ class SyncConfiguration(CMK2):
                         messages.append(("INFO", f"Deleted Group: {group_alias}"))
                         print(f"{CC.OKBLUE} *{CC.ENDC} Group {group_alias} deleted")
 
+        print(f"{CC.OKGREEN} -- {CC.ENDC} Templates: {template_cache_info()}")
+        print(f"{CC.OKGREEN} -- {CC.ENDC} Rule Needles: {needle_cache_info()}")
         log.log(f"Checkmk Group synced with {self.account_name}",
                     source="CMK_GROUP_SYNC", details=messages)
 #.
-#   .-- Export Bi Rules
-    def export_bi_rules(self):
+#   .-- Export BI
+    @staticmethod
+    def get_content_hash(data):
         """
-        Export BI Rules
+        Hash of a BI Rule or Aggregation, to find changes since the last Export
         """
-        print(f"\n{CC.HEADER}Build needed Rules{CC.ENDC}")
-        print(f"{CC.OKGREEN} -- {CC.ENDC} Loop over Hosts and collect distinct rules")
-
+        content = json.dumps(data, sort_keys=True, default=str)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
 
-        for db_host in Host.objects(available=True):
+    def collect_bi_objects(self):
+        """
+        Collect the BI Rules or Aggregations of all Hosts,
+        returns them by ID, and the Packs they belong to
+        """
+        print(f"{CC.OKGREEN} -- {CC.ENDC} Loop over Hosts and collect distinct rules")
+        unique_objects = {}
+        related_packs = set()
+        for db_host in Host.iter_hosts(exclude=['raw', 'log'], available=True):
             attributes = self.get_host_attributes(db_host, 'cmk_conf')
             if not attributes:
                 continue
             host_actions = self.actions.get_outcomes(db_host, attributes['all'])
-            unique_rules = {}
-            related_packs = []
             if host_actions:
                 for _rule_type, rules in host_actions.items():
                     for rule_params in rules:
                         # Render Template Value
-                        tpl = jinja2.Template(rule_params['rule_template'])
-                        rule_body = \
-                            tpl.render(HOSTNAME=db_host.hostname, **attributes['all'])
-                        rule_dict = ast.literal_eval(rule_body.replace('null', 'None'))
-                        unique_rules[rule_dict['id']] = rule_dict
-                        related_packs.append(rule_dict['pack_id'])
-
-
-        print(f"{CC.OKGREEN} -- {CC.ENDC} Load Rule Packs from Checkmk")
-        found_list = []
-        create_list = []
-        sync_list = []
-        delete_list = []
-        unique_rules_keys = list(unique_rules.keys())
-        for pack in related_packs:
-            print(f"{CC.HEADER}Check Pack {pack} {CC.ENDC}")
-            url = f"/objects/bi_pack/{pack}"
-            response = self.request(url, method="GET")
-            for cmk_rule in response[0]['members']['rules']['value']:
-                cmk_rule_id = cmk_rule['href'].split('/')[-1]
-                found_list.append(cmk_rule_id)
-                if cmk_rule_id not in unique_rules_keys:
-                    delete_list.append(cmk_rule_id)
-            for local_rule in unique_rules_keys:
-                if local_rule not in found_list:
-                    create_list.append(local_rule)
-                else:
-                    sync_list.append(local_rule)
-
-            for delete_id in delete_list:
-                url = f"/objects/bi_rule/{delete_id}"
-                del_response = self.request(url, method="DELETE")[1]
-                print(f"{CC.WARNING} *{CC.ENDC} Rule {delete_id} deleted. Status: {del_response}")
-
-            for create_id in create_list:
-                url = f"/objects/bi_rule/{create_id}"
-                data = unique_rules[create_id]
-                self.request(url, data=data, method="POST")
-                print(f"{CC.OKGREEN} *{CC.ENDC} Rule {create_id} created.")
-
-            for sync_id in sync_list:
-                print(f"{CC.OKGREEN} *{CC.ENDC} Check {sync_id} for Changes.")
-                url = f"/objects/bi_rule/{sync_id}"
-                cmk_rule = self.request(url, method="GET")[0]
-                if cmk_rule != unique_rules[sync_id]:
-                    print(f"{CC.WARNING}   *{CC.ENDC} Sync needed")
-                    data = unique_rules[sync_id]
-                    self.request(url, data=data,  method="PUT")
-#.
-#   .-- Export BI Aggregations
-    def export_bi_aggregations(self):
+                        rule_body = render_template(rule_params['rule_template'],
+                                                    HOSTNAME=db_host.hostname,
+                                                    **attributes['all'])
+                        object_dict = ast.literal_eval(rule_body.replace('null', 'None'))
+                        unique_objects[object_dict['id']] = object_dict
+                        related_packs.add(object_dict['pack_id'])
+        return unique_objects, related_packs
+
+    def get_bi_pack(self, entry):
         """
-        Export BI Aggregations
+        Read the IDs of the Rules or Aggregations in a Pack,
+        returns Pack, the IDs and the Error if it failed
         """
-        print(f"\n{CC.HEADER}Build needed Aggregations{CC.ENDC}")
-        print(f"{CC.OKGREEN} -- {CC.ENDC} Loop over Hosts and collect distinct rules")
+        pack, member = entry
+        url = f"/objects/bi_pack/{pack}"
+        try:
+            response = self.request(url, method="GET")[0]
+        except CmkException as error:
+            return pack, set(), error
+        found = {x['href'].split('/')[-1] for x in response['members'][member]['value']}
+        return pack, found, None
 
+    def get_bi_object(self, entry):
+        """
+        Read a Rule or Aggregation from Checkmk,
+        returns the ID, the Content and the Error if it failed
+        """
+        object_type, object_id = entry
+        try:
+            response = self.request(f"/objects/bi_{object_type}/{object_id}", method="GET")[0]
+        except CmkException as error:
+            return object_id, None, error
+        return object_id, response, None
 
-        for db_host in Host.objects(available=True):
-            attributes = self.get_host_attributes(db_host, 'cmk_conf')
-            if not attributes:
-                continue
-            host_actions = self.actions.get_outcomes(db_host, attributes['all'])
-            unique_aggregations = {}
-            related_packs = []
-            if host_actions:
-                for _rule_type, rules in host_actions.items():
-                    for rule_params in rules:
-                        # Render Template Value
-                        tpl = jinja2.Template(rule_params['rule_template'])
-                        rule_body = \
-                            tpl.render(HOSTNAME=db_host.hostname, **attributes['all'])
-                        aggregation_dict = ast.literal_eval(rule_body.replace('null', 'None'))
-                        unique_aggregations[aggregation_dict['id']] = aggregation_dict
-                        related_packs.append(aggregation_dict['pack_id'])
+    def export_bi_objects(self, object_type, full_compare=False):
+        """
+        Export BI Rules or Aggregations.
+        Every Pack is read once, and only what changed since
+        the last Export is sent to Checkmk.
+        With full_compare, or after CMK_BI_FULL_COMPARE_AGE hours, all Objects
+        are read from Checkmk, so changes made there directly are reverted.
+
+        Args:
+            object_type (string): rule or aggregation
+            full_compare (bool): Compare all Objects with Checkmk
+        """
+        member = f"{object_type}s"
+        name = object_type.capitalize()
+        messages = []
+        print(f"\n{CC.HEADER}Build needed {name}s{CC.ENDC}")
+        unique_objects, related_packs = self.collect_bi_objects()
 
+        # Content Hashes of the last Export, by ID
+        cache = self.get_cache_object(group=f"bi_{member}")
+        hashes = dict(cache.content.get('hashes', []))
+        now = datetime.datetime.now()
+        max_age = datetime.timedelta(hours=app.config['CMK_BI_FULL_COMPARE_AGE'])
+        if cache.content.get('full_compare', now - max_age) <= now - max_age:
+            full_compare = True
 
         print(f"{CC.OKGREEN} -- {CC.ENDC} Load Rule Packs from Checkmk")
-        found_list = []
-        create_list = []
-        sync_list = []
-        delete_list = []
-        unique_aggregation_keys = list(unique_aggregations.keys())
-        for pack in related_packs:
-            print(f"{CC.HEADER}Check Pack {pack} {CC.ENDC}")
-            url = f"/objects/bi_pack/{pack}"
-            response = self.request(url, method="GET")
-            for cmk_rule in response[0]['members']['aggregations']['value']:
-                cmk_rule_id = cmk_rule['href'].split('/')[-1]
-                found_list.append(cmk_rule_id)
-                if cmk_rule_id not in unique_aggregation_keys:
-                    delete_list.append(cmk_rule_id)
-            for local_rule in unique_aggregation_keys:
-                if local_rule not in found_list:
-                    create_list.append(local_rule)
+        existing = set()
+        failed_packs = set()
+        workers = app.config['CMK_CONFIG_WORKERS']
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for pack, found, error in executor.map(self.get_bi_pack,
+                                                   [(x, member) for x in sorted(related_packs)]):
+                if error:
+                    failed_packs.add(pack)
+                    print(f"{CC.FAIL} Pack {pack} not readable: {error} {CC.ENDC}")
+                    messages.append(("ERROR", f"Pack {pack} not readable: {error}"))
+                    continue
+                print(f"{CC.HEADER}Check Pack {pack} {CC.ENDC}")
+                existing.update(found)
+
+            # Content in Checkmk, by ID
+            cmk_objects = {}
+            if full_compare:
+                print(f"{CC.OKGREEN} -- {CC.ENDC} Read all {name}s from Checkmk")
+                compare_list = [(object_type, x) for x, data in unique_objects.items()
+                                if x in existing and data['pack_id'] not in failed_packs]
+                for object_id, content, error in executor.map(self.get_bi_object, compare_list):
+                    if error:
+                        print(f"{CC.FAIL} {name} {object_id} not readable: {error} {CC.ENDC}")
+                        continue
+                    cmk_objects[object_id] = content
+
+        # Sent one by one in order, since Objects can refer to each other
+        url = f"/objects/bi_{object_type}"
+        for delete_id in sorted(existing - set(unique_objects)):
+            del_response = self.request(f"{url}/{delete_id}", method="DELETE")[1]
+            hashes.pop(delete_id, None)
+            messages.append(("INFO", f"Deleted {name} {delete_id}"))
+            print(f"{CC.WARNING} *{CC.ENDC} {name} {delete_id} deleted. Status: {del_response}")
+
+        unchanged = 0
+        for object_id, data in unique_objects.items():
+            if data['pack_id'] in failed_packs:
+                continue
+            content_hash = self.get_content_hash(data)
+            if object_id not in existing:
+                method = "POST"
+            elif object_id in cmk_objects:
+                if cmk_objects[object_id] != data:
+                    method = "PUT"
                 else:
-                    sync_list.append(local_rule)
-
-            for delete_id in delete_list:
-                url = f"/objects/bi_aggregation/{delete_id}"
-                del_response = self.request(url, method="DELETE")[1]
-                print(f"{CC.WARNING} *{CC.ENDC} Aggregation {delete_id} deleted. Status: {del_response}")
-
-            for create_id in create_list:
-                url = f"/objects/bi_aggregation/{create_id}"
-                data = unique_aggregations[create_id]
-                self.request(url, data=data, method="POST")
-                print(f"{CC.OKGREEN} *{CC.ENDC} Aggregation {create_id} created.")
-
-            for sync_id in sync_list:
-                print(f"{CC.OKGREEN} *{CC.ENDC} Check Aggregation {sync_id} for Changes.")
-                url = f"/objects/bi_aggregation/{sync_id}"
-                cmk_rule = self.request(url, method="GET")[0]
-                if cmk_rule != unique_aggregations[sync_id]:
-                    print(f"{CC.WARNING}   *{CC.ENDC} Sync needed")
-                    data = unique_aggregations[sync_id]
-                    self.request(url, data=data,  method="PUT")
+                    hashes[object_id] = content_hash
+                    unchanged += 1
+                    continue
+            elif hashes.get(object_id) != content_hash:
+                method = "PUT"
+            else:
+                unchanged += 1
+                continue
+            try:
+                headers = self.request(f"{url}/{object_id}", data=data, method=method)[1]
+                if headers.get('status_code') != 200:
+                    # Some Errors are answered without Exception
+                    raise CmkException(f"Status {headers.get('status_code')}")
+            except CmkException as error:
+                # Send again next time
+                hashes.pop(object_id, None)
+                messages.append(("ERROR", f"{name} {object_id} failed: {error}"))
+                print(f"{CC.FAIL} Failue: {error} {CC.ENDC}")
+                continue
+            hashes[object_id] = content_hash
+            if method == "POST":
+                messages.append(("INFO", f"Created {name} {object_id}"))
+                print(f"{CC.OKGREEN} *{CC.ENDC} {name} {object_id} created.")
+            else:
+                messages.append(("INFO", f"Updated {name} {object_id}"))
+                print(f"{CC.WARNING} *{CC.ENDC} {name} {object_id} updated.")
+
+        cache.content['hashes'] = [[key, value] for key, value in hashes.items()
+                                   if key in unique_objects]
+        if full_compare:
+            cache.content['full_compare'] = now
+        cache.save()
+        print(f"{CC.OKGREEN} -- {CC.ENDC} {unchanged} {name}s unchanged")
+        print(f"{CC.OKGREEN} -- {CC.ENDC} Templates: {template_cache_info()}")
+        print(f"{CC.OKGREEN} -- {CC.ENDC} Rule Needles: {needle_cache_info()}")
+        log.log(f"Checkmk BI {name}s synced with {self.account_name}",
+                    source="CMK_BI_SYNC", details=messages)
+
+    def export_bi_rules(self, full_compare=False):
+        """
+        Export BI Rules
+        """
+        self.export_bi_objects('rule', full_compare)
+
+    def export_bi_aggregations(self, full_compare=False):
+        """
+        Export BI Aggregations
+        """
+        self.export_bi_objects('aggregation', full_compare)
 #.
@@ -0,0 +1,65 @@
+"""
+Plan the Checkmk Folders needed by an Export
+"""
+
+
+class FolderPlanner():
+    """
+    Tree of the Folders in Checkmk.
+    Collects the Folders which are missing, parent first,
+    so every missing Folder is created once with one Request.
+
+    Example:
+        planner = FolderPlanner(['/a', '/a/b'])
+        planner.add('/a/b/c/d')
+        planner.missing == ['/a/b/c', '/a/b/c/d']
+    """
+
+    def __init__(self, existing=None):
+        """
+        Args:
+            existing (list): Paths of the Folders already in Checkmk
+        """
+        # Trie of the Folder Names, every Node is a dict of its Subfolders
+        self.tree = {}
+        # Full Paths, for the quick check of already known Folders
+        self.known = {'/'}
+        self.missing = []
+        for path in existing or []:
+            self._insert(path, missing=False)
+
+    @staticmethod
+    def split_path(path):
+        """
+        Return the Names of the Folder Path, without empty ones
+        """
+        return [x for x in path.split('/') if x]
+
+    @staticmethod
+    def split_parent(path):
+        """
+        Return Parent Path and Name of a Folder
+        """
+        parent, name = path.rsplit('/', 1)
+        return parent or '/', name
+
+    def _insert(self, path, missing):
+        """Add the Path and all its Ancestors to the Tree"""
+        node = self.tree
+        current = ''
+        for name in self.split_path(path):
+            current += '/' + name
+            if name not in node:
+                node[name] = {}
+                self.known.add(current)
+                if missing:
+                    self.missing.append(current)
+            node = node[name]
+
+    def add(self, path):
+        """
+        Register a Folder the Export needs
+        """
+        if path in self.known:
+            return
+        self._insert(path, missing=True)
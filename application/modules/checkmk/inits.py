@@ -13,7 +13,7 @@ from application.modules.checkmk.models import CheckmkRuleMngmt, CheckmkBiRule,
 from application.plugins.checkmk import _load_rules
 
 #   .-- Export BI Rules
-def export_bi_rules(account):
+def export_bi_rules(account, full_compare=False):
     """
     Export BI Rules to Checkmk
     """
@@ -21,20 +21,21 @@ def export_bi_rules(account):
         target_config = get_account_by_name(account)
         if target_config:
             syncer = SyncConfiguration()
+            syncer.account = target_config['_id']
             syncer.account_id = str(target_config['_id'])
             syncer.account_name = target_config['name']
             syncer.config = target_config
             actions = DefaultRule()
             actions.rules = CheckmkBiRule.objects(enabled=True)
             syncer.actions = actions
-            syncer.export_bi_rules()
+            syncer.export_bi_rules(full_compare)
         else:
             print(f"{ColorCodes.FAIL} Config not found {ColorCodes.ENDC}")
     except CmkException as error_obj:
         print(f'C{ColorCodes.FAIL}MK Connection Error: {error_obj} {ColorCodes.ENDC}')
 #.
 #   .-- Export BI Aggregations
-def export_bi_aggregations(account):
+def export_bi_aggregations(account, full_compare=False):
     """
     Export BI Aggregations to Checkmk
     """
@@ -42,13 +43,14 @@ def export_bi_aggregations(account):
         target_config = get_account_by_name(account)
         if target_config:
             syncer = SyncConfiguration()
+            syncer.account = target_config['_id']
             syncer.account_id = str(target_config['_id'])
             syncer.account_name = target_config['name']
             syncer.config = target_config
             actions = DefaultRule()
             actions.rules = CheckmkBiAggregation.objects(enabled=True)
             syncer.actions = actions
-            syncer.export_bi_aggregations()
+            syncer.export_bi_aggregations(full_compare)
         else:
             print(f"{ColorCodes.FAIL} Config not found {ColorCodes.ENDC}")
     except CmkException as error_obj:
@@ -73,9 +75,8 @@ def inventorize_hosts(account):
 
     print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Collecting Config Data")
     url = "domain-types/host_config/collections/all?effective_attributes=true"
-    api_hosts = cmk.request(url, method="GET")
     config_inventory = {}
-    for host in api_hosts[0]['value']:
+    for host in cmk.request_collection(url):
         hostname = host['id']
         attributes = host['extensions']['effective_attributes']
         host_inventory = {}
@@ -99,9 +100,8 @@ def inventorize_hosts(account):
            ['host_name', 'description', 'state', 'plugin_output'],
     }
     print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Collecting Status Data")
-    api_response = cmk.request(url, data=params, method="GET")
     status_inventory = {}
-    for service in api_response[0]['value']:
+    for service in cmk.request_collection(url, data=params):
         host_name = service['extensions']['host_name']
         service_description = service['extensions']['description'].lower().replace(' ', '_')
         service_state = service['extensions']['state']
@@ -130,12 +130,11 @@ def show_missing(account):
     cmk = CMK2()
     cmk.config = config
 
-    local_hosts = list([x.hostname for x in Host.objects()])
+    local_hosts = set(Host.objects().scalar('hostname'))
     print(f"{ColorCodes.OKBLUE}Started {ColorCodes.ENDC} with account "\
           f"{ColorCodes.UNDERLINE}{account}{ColorCodes.ENDC}")
     url = "domain-types/host_config/collections/all?effective_attributes=false"
-    api_hosts = cmk.request(url, method="GET")
-    for host in api_hosts[0]['value']:
+    for host in cmk.request_collection(url):
         hostname = host['id']
         if hostname not in local_hosts:
             print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} {hostname}")
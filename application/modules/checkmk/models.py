@@ -393,7 +393,10 @@ class CheckmkObjectCache(db.Document):
     content = db.DictField()
 
     meta = {
-        'strict': False
+        'strict': False,
+        'indexes': [
+            ('cache_group', 'account'),
+        ],
     }
 
 #.
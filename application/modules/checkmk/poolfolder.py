@@ -3,30 +3,99 @@
 """
 Helper to find a free Poolfolder
 """
-from mongoengine.errors import DoesNotExist
+from pymongo import ReturnDocument
 from application.modules.checkmk.models import CheckmkFolderPool
 
+# Only take a seat if there is one left
+_FREE_SEAT = {'$expr': {'$lt': ['$folder_seats_taken', '$folder_seats']}}
 
-def get_folder(only_pools=None):
-    """ Try to find a free Pool Folder """
-    if only_pools:
-        query = CheckmkFolderPool.objects(folder_name__in=only_pools).order_by('folder_name')
-    else:
-        query = CheckmkFolderPool.objects().order_by('folder_name')
-    for folder in query:
-        if folder.has_free_seat():
-            folder.folder_seats_taken += 1
-            folder.save()
-            return folder.folder_name
-    return False
+
+def take_seat(folder_name):
+    """
+    Take a seat in the Pool with one atomic write.
+    Returns the Pool after the update, or None if the Pool is full.
+    """
+    query = {'folder_name': folder_name}
+    query.update(_FREE_SEAT)
+    return CheckmkFolderPool._get_collection().find_one_and_update( #pylint: disable=protected-access
+        query, {'$inc': {'folder_seats_taken': 1}},
+        projection={'folder_seats': 1, 'folder_seats_taken': 1},
+        return_document=ReturnDocument.AFTER)
 
 
 def remove_seat(folder_name):
-    """ Remove a seat from Folder Pool """
-    try:
-        folder = CheckmkFolderPool.objects.get(folder_name=folder_name)
-        if folder.folder_seats_taken > 0:
-            folder.folder_seats_taken -= 1
-            folder.save()
-    except DoesNotExist:
-        pass
+    """ Remove a seat from Folder Pool, returns True if one was taken """
+    result = CheckmkFolderPool._get_collection().update_one( #pylint: disable=protected-access
+        {'folder_name': folder_name, 'folder_seats_taken': {'$gt': 0}},
+        {'$inc': {'folder_seats_taken': -1}})
+    return bool(result.modified_count)
+
+
+def get_folder(only_pools=None):
+    """ Try to find a free Pool Folder, for a single Host """
+    return FolderPoolSeats().get_folder(only_pools)
+
+
+class FolderPoolSeats():
+    """
+    View of the free Seats for one Run.
+    The Pools are read once, then every Seat costs one atomic write.
+    Concurrent Runs can't oversubscribe a Pool, since the write
+    only succeeds if a Seat is left.
+    With dry_run, Seats are only counted in the view, nothing is written.
+    """
+
+    def __init__(self, dry_run=False):
+        self.free = None
+        self.dry_run = dry_run
+
+    def load(self):
+        """
+        Read the free Seats of all Pools, ordered by Name
+        """
+        self.free = {}
+        for pool in CheckmkFolderPool.objects().order_by('folder_name')\
+                        .only('folder_name', 'folder_seats', 'folder_seats_taken'):
+            self.free[pool.folder_name] = pool.folder_seats - (pool.folder_seats_taken or 0)
+
+    def _find_seat(self, only_pools):
+        """ Take a Seat in the first Pool with free Seats in the view """
+        for folder_name, free in self.free.items():
+            if free <= 0:
+                continue
+            if only_pools and folder_name not in only_pools:
+                continue
+            if self.dry_run:
+                self.free[folder_name] -= 1
+                return folder_name
+            pool = take_seat(folder_name)
+            if not pool:
+                # Taken by someone else meanwhile
+                self.free[folder_name] = 0
+                continue
+            self.free[folder_name] = pool['folder_seats'] - pool['folder_seats_taken']
+            return folder_name
+        return False
+
+    def get_folder(self, only_pools=None):
+        """ Try to find a free Pool Folder """
+        if self.free is None:
+            self.load()
+            return self._find_seat(only_pools)
+        if folder_name := self._find_seat(only_pools):
+            return folder_name
+        if self.dry_run:
+            # Reading again would forget the Seats we counted
+            return False
+        # Seats may got free meanwhile, or Pools were added
+        self.load()
+        return self._find_seat(only_pools)
+
+    def remove_seat(self, folder_name):
+        """ Remove a seat from Folder Pool """
+        if self.dry_run:
+            if self.free and folder_name in self.free:
+                self.free[folder_name] += 1
+            return
+        if remove_seat(folder_name) and self.free and folder_name in self.free:
+            self.free[folder_name] += 1
@@ -49,6 +49,9 @@ class CheckmkRule(Rule): # pylint: disable=too-few-public-methods
 
     found_poolfolder_rule = False # Spcific Helper for this kind of action
     db_host = False
+    pool_seats = None # Free Seats of the Folder Pools in this run
+    dry_run = False # Only plan, the Pool Seats are not taken or freed
+    pool_changes = None # Seats a dry run would take or free, by Hostname
 
     @staticmethod
     def format_foldername(folder):
@@ -90,11 +93,17 @@ class CheckmkRule(Rule): # pylint: disable=too-few-public-methods
                     only_pools = None
                     if outcome['action_param']:
                         only_pools = [x.strip() for x in outcome['action_param'].split(',')]
-                    folder = poolfolder.get_folder(only_pools)
-                    if not folder:
+                    pool_name = self.get_pool_seats().get_folder(only_pools)
+                    if not pool_name:
                         raise Exception(f"No Pool Folder left for {self.db_host.hostname}")
-                    folder = self.format_foldername(folder)
-                    self.db_host.lock_to_folder(folder)
+                    folder = self.format_foldername(pool_name)
+                    if self.dry_run:
+                        self.get_pool_changes()[self.db_host.hostname] = {
+                            'take': pool_name,
+                            'lock': folder,
+                        }
+                    else:
+                        self.db_host.lock_to_folder(folder)
                     outcomes['move_folder'] += folder
 
             if outcome['action'] == 'attribute':
@@ -163,6 +172,22 @@ class CheckmkRule(Rule): # pylint: disable=too-few-public-methods
 
 
 
+    def get_pool_seats(self):
+        """
+        Return the Folder Pool Seats of this run
+        """
+        if not self.pool_seats:
+            self.pool_seats = poolfolder.FolderPoolSeats(dry_run=self.dry_run)
+        return self.pool_seats
+
+    def get_pool_changes(self):
+        """
+        Return the Pool Seats the dry run would take or free
+        """
+        if self.pool_changes is None:
+            self.pool_changes = {}
+        return self.pool_changes
+
     def check_rule_match(self, db_host):
         """
         Overwritten cause of folder_pool
@@ -179,6 +204,9 @@ class CheckmkRule(Rule): # pylint: disable=too-few-public-methods
         if not self.found_poolfolder_rule:
             if db_host.get_folder():
                 old_folder = db_host.get_folder()
-                db_host.lock_to_folder(False)
-                poolfolder.remove_seat(old_folder)
+                if self.dry_run:
+                    self.get_pool_changes()[hostname] = {'release': old_folder}
+                else:
+                    db_host.lock_to_folder(False)
+                self.get_pool_seats().remove_seat(old_folder)
         return outcomes
@@ -2,17 +2,60 @@
 Add Hosts into CMK Version 2 Installations
 """
 #pylint: disable=too-many-arguments, too-many-statements, consider-using-get, no-member, too-many-locals, too-many-branches
+#pylint: disable=too-many-public-methods, too-many-instance-attributes
+import datetime
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pymongo import UpdateOne
+from mongoengine.errors import DoesNotExist
 from application.models.host import Host
 from application.modules.checkmk.cmk2 import CMK2, CmkException
+from application.modules.checkmk.folders import FolderPlanner
+from application.modules.checkmk.models import CheckmkObjectCache
+from application.modules.checkmk import poolfolder
 from application.modules.debug import ColorCodes
-from application import logger
+from application import app, logger
 
 
 class SyncCMK2(CMK2):
     """
-    Sync Functions
+    Sync Functions.
+    The Sync is done in two Phases: plan() reads Checkmk and the Rules
+    and returns the needed Changes, apply_plan() sends them to Checkmk.
     """
-
+    # List of Hostnames, only they are exported
+    limit = False
+    # Number of parallel workers for the API calls of the hosts
+    workers = 1
+    # Hosts per Bulk Request, 0 means one Request per Host,
+    # None takes CMK_BULK_SIZE
+    bulk_size = None
+    # Compare all Hosts with Checkmk, not only the ones with new Fingerprints
+    full_compare = False
+
+    bulk_endpoints = {
+        'create': ("domain-types/host_config/actions/bulk-create/invoke", "POST"),
+        'update': ("domain-types/host_config/actions/bulk-update/invoke", "PUT"),
+        'delete': ("domain-types/host_config/actions/bulk-delete/invoke", "POST"),
+    }
+
+    def __init__(self):
+        """
+        Inital
+        """
+        super().__init__()
+        self.executor = None
+        self.pending = []
+        self.bulk_queue = {}
+        self.bulk_lock = threading.Lock()
+        self.pending_lock = threading.Lock()
+        # ETags of the last write responses, so we don't need to read them again
+        self.etags = {}
+        self.planned_etags = {}
+        # Hosts of which a Change failed, they keep their old Fingerprint
+        self.failed_hosts = set()
 
 #   .-- Get Host Actions
     def get_host_actions(self, db_host, attributes):
@@ -22,48 +65,281 @@ class SyncCMK2(CMK2):
         return self.actions.get_outcomes(db_host, attributes)
 
 #.
-#   .-- Run Sync
-    def run(self): #pylint: disable=too-many-locals, too-many-branches
-        """Run Job"""
-        # In Order to delete Hosts from Checkmk, we collect the ones we sync
-        synced_hosts = []
+#   .-- Workers
+    def submit(self, function, *args):
+        """
+        Run the API calls in the Thread Pool if workers are enabled,
+        without waiting for a free worker.
+        Also used from the workers, e.g. for the fallback of a failed Batch.
+        """
+        if not self.executor:
+            function(*args)
+            return
+        future = self.executor.submit(function, *args)
+        with self.pending_lock:
+            self.pending.append(future)
 
-        # Get all current folders in order that we later now,
-        # which we need to create
-        print(f"{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}CACHE: Read all folders from cmk")
-        url = "domain-types/folder_config/collections/all"
-        url += "?parent=/&recursive=true&show_hosts=false"
-        api_folders = self.request(url, method="GET")
-        existing_folders = []
-        if not api_folders[0]:
-            raise CmkException("Cant connect or auth with CMK")
-        for folder in api_folders[0]['value']:
-            existing_folders.append(folder['extensions']['path'])
+    def dispatch(self, function, *args):
+        """
+        Run the API calls of a Host.
+        With workers enabled, this happens in the Thread Pool.
+        The number of waiting Hosts is limited, so that the
+        caller don't run to far ahead. Only call it from the main thread.
+        """
+        self.submit(function, *args)
+        with self.pending_lock:
+            if len(self.pending) < self.workers * 2:
+                return
+            pending, self.pending = self.pending, []
+        done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+        with self.pending_lock:
+            self.pending.extend(not_done)
+        for future in done:
+            # Raises the exceptions of the worker
+            future.result()
+
+    def wait_for_workers(self):
+        """
+        Wait until all dispatched API calls are done,
+        also the ones they started themselves
+        """
+        while True:
+            with self.pending_lock:
+                pending, self.pending = self.pending, []
+            if not pending:
+                return
+            done, _ = wait(pending)
+            for future in done:
+                future.result()
+
+#.
+#   .-- Bulk Requests
+    def queue_bulk(self, action, entry):
+        """
+        Queue a Host for the Bulk Endpoint of the action.
+        The Batch is send once it reaches bulk_size.
+        """
+        with self.bulk_lock:
+            queue = self.bulk_queue.setdefault(action, [])
+            queue.append(entry)
+            if len(queue) < self.bulk_size:
+                return
+            self.bulk_queue[action] = []
+        self.dispatch(self.send_bulk, action, queue)
 
+    def flush_bulk(self, action):
+        """
+        Send the rest of the queued Hosts of the action.
+        Call wait_for_workers() afterwards.
+        """
+        with self.bulk_lock:
+            queue = self.bulk_queue.get(action, [])
+            self.bulk_queue[action] = []
+        if queue:
+            self.dispatch(self.send_bulk, action, queue)
 
+    def send_bulk(self, action, batch):
+        """
+        Send a Batch to the Bulk Endpoint.
+        If the Batch fails, every Host is send on its own.
+        """
+        url, method = self.bulk_endpoints[action]
+        try:
+            _, headers = self.request(url, method=method, data={'entries': batch})
+            success = headers.get('status_code') in [200, 204]
+        except CmkException as error:
+            logger.debug(f"Bulk {action} failed: {error}")
+            success = False
+
+        if not success:
+            print(f"{ColorCodes.WARNING} *{ColorCodes.ENDC} Bulk {action} of "\
+                  f"{len(batch)} hosts failed, fallback to single requests")
+            for entry in batch:
+                self.submit(self.send_single, action, entry)
+            return
 
-        # Get ALL hosts in order to compare them
-        print(f"{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}CACHE: Read all hosts from cmk")
-        url = "domain-types/host_config/collections/all"
-        api_hosts = self.request(url, method="GET")
-        cmk_hosts = {}
-        for host in api_hosts[0]['value']:
-            cmk_hosts[host['id']] = host
+        print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} Bulk {action} of {len(batch)} hosts done")
+        if action == 'update':
+            hostnames = [x['host_name'] for x in batch]
+            for hostname in hostnames:
+                # The bulk response has no ETags per host
+                self.etags.pop(hostname, None)
+            Host.touch_export(hostnames)
 
+    def send_single(self, action, entry):
+        """
+        Send one Host with the Single Host Endpoints.
+        Failed Hosts are recorded, so they keep their old Fingerprint.
+        """
+        try:
+            getattr(self, f"{action}_host")(entry)
+        except CmkException as error:
+            self.failed_hosts.add(entry if action == 'delete' else entry['host_name'])
+            print(f"{ColorCodes.FAIL} *{ColorCodes.ENDC} {action} of host failed: {error}")
 
+    def send(self, action, entry):
+        """
+        Send the Change with the Bulk Endpoint if enabled, or dispatch it
+        """
+        if self.bulk_size:
+            self.queue_bulk(action, entry)
+        else:
+            self.dispatch(self.send_single, action, entry)
+
+    def check_write(self, action, hostname, response):
+        """
+        Check the Status of a write Request.
+        Checkmk answers some Errors without an Exception,
+        the Host is then recorded as failed and tried again next time.
+
+        Args:
+            action (string): Name of the Change, for the Output
+            hostname (string): Name of the Host
+            response (dict|int): Headers of the Response, or the Status Code of a Delete
+        """
+        status_code = response if isinstance(response, int) else response.get('status_code')
+        if status_code in [200, 204]:
+            return True
+        self.failed_hosts.add(hostname)
+        print(f"{ColorCodes.FAIL} *{ColorCodes.ENDC} {action} of {hostname} failed: "\
+              f"Status {status_code}")
+        return False
 
-        ## Start SYNC of Hosts into CMK
-        print(f"\n{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Start Sync")
-        db_objects = Host.objects(available=True)
-        total = len(db_objects)
+#.
+#   .-- Run Sync
+    def run(self, dry_run=False):
+        """
+        Run Job: Plan the Changes and apply them.
+        With dry_run, the plan is only returned.
+        """
+        plan = self.plan(dry_run=dry_run)
+        if dry_run:
+            return plan
+        self.apply_plan(plan, self.planned_etags)
+        return plan
+
+    def apply_plan(self, plan, etags=None):
+        """
+        Apply a plan, returned by plan() or loaded from a file, to Checkmk
+
+        Args:
+            plan (dict): Plan from plan()
+            etags (dict): ETags read while planning, only valid if applied directly
+        """
+        if self.bulk_size is None:
+            self.bulk_size = app.config['CMK_BULK_SIZE']
+        self.bulk_queue = {}
+        self.etags = dict(etags or {})
+        self.failed_hosts = set()
+        self.pending = []
+        if self.workers <= 1:
+            self._apply_plan(plan)
+            return
+        print(f"{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Use {self.workers} workers for API calls")
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            self.executor = executor
+            try:
+                self._apply_plan(plan)
+            finally:
+                self.executor = None
+
+    @staticmethod
+    def get_fingerprint(desired):
+        """
+        Hash of everything we export of a Host
+        """
+        content = json.dumps(desired, sort_keys=True, default=str)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def get_cmk_hosts(self, candidates, full):
+        """
+        Read the Hosts we need to compare from Checkmk.
+        Either all with one Request, or only the given ones.
+        """
+        cmk_hosts = {}
+        if full:
+            print(f"{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}CACHE: Read all hosts from cmk")
+            url = "domain-types/host_config/collections/all"
+            for host in self.request_collection(url):
+                # Keep only what we compare
+                extensions = host['extensions']
+                cmk_hosts[host['id']] = {'extensions': {
+                    'folder': extensions['folder'],
+                    'attributes': extensions['attributes'],
+                    'cluster_nodes': extensions.get('cluster_nodes'),
+                }}
+            return cmk_hosts
+
+        print(f"{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}CACHE: Read "\
+              f"{len(candidates)} changed hosts from cmk")
+        for desired in candidates:
+            hostname = desired['host_name']
+            host, headers = self.request(f"objects/host_config/{hostname}", method="GET")
+            if host:
+                cmk_hosts[hostname] = host
+                if etag := headers.get('ETag'):
+                    self.planned_etags[hostname] = etag
+        return cmk_hosts
+
+    def plan(self, dry_run=False):
+        """
+        Compare the Hosts of the Database with Checkmk
+        and return the needed Changes. No write calls are made to Checkmk.
+        With dry_run, also the Folder Pool Seats are only planned,
+        they are taken once the plan is applied.
+
+        Hosts with the same Fingerprint as on their last Export are skipped,
+        unless full_compare is set, in limit mode, or after CMK_HOST_FULL_COMPARE_AGE hours.
+        """
+        plan = {
+            'account': self.account_name,
+            'created': datetime.datetime.now().isoformat(),
+            'limit': bool(self.limit),
+            'folders': [],
+            'moves': [],
+            'creates': [],
+            'updates': [],
+            'clusters': [],
+            'cluster_updates': [],
+            'deletes': [],
+            # Saved for the Hosts once the plan is applied
+            'fingerprints': {},
+            # Folder Pool Seats to take or free, only set by a dry run
+            'pool_changes': {},
+            # All Hosts are compared, stored once the plan is applied
+            'full_compare': False,
+        }
+        self.planned_etags = {}
+        self.actions.dry_run = dry_run
+        self.actions.pool_changes = None
+        # In Order to delete Hosts from Checkmk, we collect the ones we sync
+        synced_hosts = set()
+        # Hosts which changed since their last export
+        candidates = []
+        folders = FolderPlanner()
+        cmk_hosts = {}
+
+        full_compare = self.full_compare
+        if not self.limit and not full_compare:
+            # Also finds Hosts deleted from the Database, which have no Fingerprint anymore
+            now = datetime.datetime.now()
+            max_age = datetime.timedelta(hours=app.config['CMK_HOST_FULL_COMPARE_AGE'])
+            last_compare = self.get_compare_cache().content.get('last_full_compare')
+            if not last_compare or last_compare <= now - max_age:
+                print(f"{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Last full compare "\
+                      f"older than {app.config['CMK_HOST_FULL_COMPARE_AGE']}h, compare all hosts")
+                full_compare = True
+        plan['full_compare'] = full_compare and not self.limit
+
+        ## Start Planing of the Hosts
+        print(f"\n{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Start Planing")
+        filters = {'available': True}
+        if self.limit:
+            filters['hostname__in'] = self.limit
+        total = Host.objects(**filters).count()
         counter = 0
-        clusters = []
-        cluster_updates = []
-        for db_host in db_objects:
+        for db_host in Host.iter_hosts(exclude=['raw', 'log'], **filters):
             counter += 1
-            if self.limit:
-                if db_host.hostname not in self.limit:
-                    continue
             # Actions
             process = 100.0 * counter / total
             print(f"\n{ColorCodes.HEADER}({process:.0f}%) {db_host.hostname}{ColorCodes.ENDC}")
@@ -77,7 +353,7 @@ class SyncCMK2(CMK2):
 
             labels = {k:str(v) for k,v in attributes['filtered'].items()}
 
-            synced_hosts.append(db_host.hostname)
+            synced_hosts.add(db_host.hostname)
             labels['cmdb_syncer'] = self.account_id
 
             folder = '/'
@@ -90,11 +366,6 @@ class SyncCMK2(CMK2):
             if 'create_cluster' in next_actions:
                 cluster_nodes = next_actions['create_cluster']
 
-            if folder not in existing_folders:
-                # We may need to create them later
-                self.create_folder(folder)
-                existing_folders.append(folder)
-
             additional_attributes = {}
             remove_attributes = []
             if 'remove_attributes' in next_actions:
@@ -116,179 +387,340 @@ class SyncCMK2(CMK2):
                 if attr_value := attributes['all'].get(additional_attr):
                     additional_attributes[additional_attr] = attr_value
 
+            desired = {
+                'host_name': db_host.hostname,
+                'folder': folder,
+                'labels': labels,
+                'additional_attributes': additional_attributes,
+                'remove_attributes': remove_attributes,
+                'cluster_nodes': cluster_nodes,
+            }
+            fingerprint = self.get_fingerprint(desired)
+            # In limit mode, the listed Hosts are always compared
+            if not full_compare and not self.limit and \
+                    db_host.export_fingerprints.get(self.account_id) == fingerprint:
+                print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} Unchanged since last export")
+                continue
+            plan['fingerprints'][db_host.hostname] = fingerprint
+            candidates.append(desired)
+
+        # With too many changes, one big request is faster.
+        # In limit mode, we only need the listed hosts
+        full = not self.limit and \
+                (full_compare or len(candidates) > app.config['CMK_FINGERPRINT_FETCH_LIMIT'])
+        fingerprint_query = {f'export_fingerprints.{self.account_id}': {'$exists': True}}
+        if candidates:
+            # Get all current folders in order that we later now,
+            # which we need to create
+            print(f"{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}CACHE: Read all folders from cmk")
+            url = "domain-types/folder_config/collections/all"
+            url += "?parent=/&recursive=true&show_hosts=false"
+            api_folders = self.request(url, method="GET")
+            if not api_folders[0]:
+                raise CmkException("Cant connect or auth with CMK")
+            folders = FolderPlanner([x['extensions']['path'] for x in api_folders[0]['value']])
+        if candidates or full:
+            cmk_hosts = self.get_cmk_hosts(candidates, full)
+
+        print(f"\n{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Compare "\
+              f"{len(candidates)} changed hosts with Checkmk")
+        for desired in candidates:
+            hostname = desired['host_name']
+            print(f"\n{ColorCodes.HEADER}{hostname}{ColorCodes.ENDC}")
+            folder = desired['folder']
+            # Missing ones are created before the hosts
+            folders.add(folder)
+
+            body = {
+                'host_name' : hostname,
+                'folder' : '/' if not folder else folder,
+                'attributes': {
+                    'labels' : desired['labels'],
+                }
+            }
+            if desired['additional_attributes']:
+                body['attributes'].update(desired['additional_attributes'])
 
-            if db_host.hostname not in cmk_hosts:
+            cluster_nodes = desired['cluster_nodes']
+            if hostname not in cmk_hosts:
                 # Create since missing
                 if cluster_nodes:
                     print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Will be created as Cluster")
                     # We need to create them Later, since we not know that we have all nodes
-                    clusters.append((db_host, folder, labels, \
-                                        cluster_nodes, additional_attributes))
+                    body['nodes'] = cluster_nodes
+                    plan['clusters'].append(body)
                 else:
                     print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Need to created in Checkmk")
-                    self.create_host(db_host, folder, labels, additional_attributes)
-                # Add Host information to the dict, for later cleanup.
-                # So no need to query all the hosta again
-                cmk_hosts[db_host.hostname] = \
-                            {'extensions': {
-                                'attributes':{
-                                     'labels': {
-                                          'cmdb_syncer': self.account_id
-                                }}
-                             }}
+                    plan['creates'].append(body)
             else:
-                cmk_host = cmk_hosts[db_host.hostname]
-                # Update if needed
-                self.update_host(db_host, cmk_host, folder,
-                                labels, additional_attributes, remove_attributes)
+                cmk_host = cmk_hosts[hostname]
+                self.plan_update(plan, hostname, cmk_host, folder, desired['labels'],
+                                 desired['additional_attributes'], desired['remove_attributes'])
                 if cluster_nodes:
                     cmk_cluster = cmk_host['extensions']['cluster_nodes']
-                    cluster_updates.append((db_host, cmk_cluster, cluster_nodes))
-
-
-
-            db_host.save()
+                    if cmk_cluster != cluster_nodes:
+                        print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} "\
+                              f"Cluster has new Nodes {cluster_nodes}")
+                        plan['cluster_updates'].append({
+                            'host_name': hostname,
+                            'nodes': cluster_nodes,
+                        })
+
+        # Parent first, so they can be created in this order
+        plan['folders'] = folders.missing
+        plan['pool_changes'] = self.actions.pool_changes or {}
 
         if self.limit:
+            # Clusters may miss their nodes and all other hosts are not synced
+            for entry in plan['clusters'] + plan['cluster_updates']:
+                plan['fingerprints'].pop(entry['host_name'], None)
+            plan['clusters'] = []
+            plan['cluster_updates'] = []
+            return plan
+
+        ## Cleanup, delete Hosts from this Source who are not longer in our DB or synced
+        if full:
+            # Get all hosts with cmdb_syncer label and delete if not in synced_hosts
+            for host, host_data in cmk_hosts.items():
+                host_labels = host_data['extensions']['attributes'].get('labels',{})
+                if host_labels.get('cmdb_syncer') == self.account_id:
+                    if host not in synced_hosts:
+                        plan['deletes'].append(host)
+        else:
+            # All Hosts we exported before, and don't sync anymore
+            for db_host in Host.objects(__raw__=fingerprint_query).only('hostname'):
+                if db_host.hostname not in synced_hosts:
+                    plan['deletes'].append(db_host.hostname)
+        return plan
+
+    def _apply_plan(self, plan):
+        """Send the Changes of the plan to Checkmk"""
+        print(f"\n{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Apply Plan: "\
+              f"{self.get_plan_summary(plan)}")
+        self.apply_pool_changes(plan)
+        for folder in plan['folders']:
+            self.create_folder(folder)
+
+        # Moves first, so the Updates can use their ETags
+        for entry in plan['moves']:
+            self.dispatch(self.send_single, 'move', entry)
+        self.wait_for_workers()
+
+        for entry in plan['creates']:
+            self.send('create', entry)
+        for entry in plan['updates']:
+            print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Update {entry['host_name']}: "\
+                  f"{', '.join(entry['reasons'])}")
+            self.send('update', {k: v for k, v in entry.items() if k != 'reasons'})
+
+        # Clusters need their nodes, so all hosts have to be done first
+        self.flush_bulk('create')
+        self.flush_bulk('update')
+        self.wait_for_workers()
+
+        if plan['limit']:
             print(f"\n{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Stop processing in limit mode")
+            self.save_fingerprints(plan)
+            print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} API {self.get_request_summary()}")
             return
         ## Create the Clusters
         print(f"\n{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Check if we need to handle Clusters")
-        for cluster in clusters:
-            self.create_cluster(*cluster)
-        for cluster in cluster_updates:
-            self.update_cluster_nodes(*cluster)
+        for entry in plan['clusters']:
+            self.create_cluster(entry)
+        for entry in plan['cluster_updates']:
+            self.update_cluster_nodes(entry)
 
-        ## Cleanup, delete Hosts from this Source who are not longer in our DB or synced
-        # Get all hosts with cmdb_syncer label and delete if not in synced_hosts
         print(f"\n{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Check if we need to cleanup hosts")
-        for host, host_data in cmk_hosts.items():
-            host_labels = host_data['extensions']['attributes'].get('labels',{})
-            if host_labels.get('cmdb_syncer') == self.account_id:
-                if host not in synced_hosts:
-                    # Delete host
-                    url = f"objects/host_config/{host}"
-                    self.request(url, method="DELETE")
-                    print(f"{ColorCodes.WARNING} *{ColorCodes.ENDC} Deleted host {host}")
+        for host in plan['deletes']:
+            self.send('delete', host)
+        self.flush_bulk('delete')
+        self.wait_for_workers()
+        self.save_fingerprints(plan)
+        if plan.get('full_compare') and not self.failed_hosts:
+            cache = self.get_compare_cache()
+            cache.content['last_full_compare'] = datetime.datetime.now()
+            cache.save()
         print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} Cleanup Done")
+        print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} API {self.get_request_summary()}")
+
+    def apply_pool_changes(self, plan):
+        """
+        Take and free the Folder Pool Seats planned by a dry run.
+        Hosts which find no free Seat anymore are not created or moved.
+        """
+        skipped = set()
+        for hostname, change in plan.get('pool_changes', {}).items():
+            db_host = Host.objects(hostname=hostname).only('hostname', 'folder').first()
+            if not db_host:
+                continue
+            if 'release' in change:
+                db_host.lock_to_folder(False)
+                poolfolder.remove_seat(change['release'])
+                continue
+            if not poolfolder.take_seat(change['take']):
+                print(f"{ColorCodes.FAIL} *{ColorCodes.ENDC} No Seat left in Pool "\
+                      f"{change['take']} for {hostname}")
+                skipped.add(hostname)
+                continue
+            db_host.lock_to_folder(change['lock'])
+        if not skipped:
+            return
+        self.failed_hosts.update(skipped)
+        for key in ['moves', 'creates', 'updates', 'clusters', 'cluster_updates']:
+            plan[key] = [x for x in plan[key] if x['host_name'] not in skipped]
+
+    def get_compare_cache(self):
+        """
+        Get the Cache Object with the Time of the last full compare
+        """
+        try:
+            return CheckmkObjectCache.objects.get(cache_group='host_full_compare',
+                                                  account=self.account)
+        except DoesNotExist:
+            new = CheckmkObjectCache()
+            new.cache_group = 'host_full_compare'
+            new.account = self.account
+            return new
+
+    def save_fingerprints(self, plan):
+        """
+        Store the Fingerprints of the exported Hosts,
+        and forget them for the deleted ones.
+        Hosts which failed keep their old Fingerprint, so they are tried again.
+        """
+        field = f'export_fingerprints.{self.account_id}'
+        operations = []
+        for hostname, fingerprint in plan['fingerprints'].items():
+            if hostname not in self.failed_hosts:
+                operations.append(UpdateOne({'hostname': hostname},
+                                            {'$set': {field: fingerprint}}))
+        for hostname in plan['deletes']:
+            if hostname not in self.failed_hosts:
+                operations.append(UpdateOne({'hostname': hostname}, {'$unset': {field: ""}}))
+        if operations:
+            Host._get_collection().bulk_write(operations, ordered=False) #pylint: disable=protected-access
+
+    @staticmethod
+    def get_plan_summary(plan):
+        """
+        Return the Number of Changes per Type as String
+        """
+        keys = ['folders', 'moves', 'creates', 'updates', 'clusters', 'cluster_updates', 'deletes']
+        return ", ".join(f"{len(plan[key])} {key}" for key in keys)
 #.
 #   .-- Create Folder
-    def _create_folder(self, parent, subfolder):
-        """ Helper to create tree of folders """
+    def create_folder(self, folder):
+        """
+        Create the Folder, its Parent needs to exist
+        """
         url = "domain-types/folder_config/collections/all"
-        if not subfolder:
-            return
+        parent, name = FolderPlanner.split_parent(folder)
         body = {
-            "name": subfolder,
-            "title": subfolder,
+            "name": name,
+            "title": name,
             "parent": parent,
         }
         try:
             self.request(url, method="POST", data=body)
+            print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} Created Folder {folder}")
         except CmkException:
             # We ignore an existing folder
             pass
 
-
-    def create_folder(self, folder):
-        """ Create given folder if not yet exsisting """
-        folder_parts = folder.split('/')[1:]
-        if len(folder_parts) == 1:
-            if folder_parts[0] == '':
-                # we are in page root
-                return
-            parent = '/'
-            subfolder = folder_parts[0]
-            self._create_folder(parent, subfolder)
-        else:
-            next_parent = '/'
-            for sub_folder in folder_parts:
-                self._create_folder(next_parent, sub_folder)
-                if next_parent == '/':
-                    next_parent += sub_folder
-                else:
-                    next_parent  += '/' + sub_folder
-
 #.
 #   .-- Create Host
 
-    def create_host(self, db_host, folder, labels, additional_attributes=None):
+    def create_host(self, body):
         """
         Create the not yet existing host in CMK
         """
         url = "/domain-types/host_config/collections/all"
-        body = {
-            'host_name' : db_host.hostname,
-            'folder' : '/' if not folder else folder,
-            'attributes': {
-                'labels' : labels,
-            }
-        }
-        if additional_attributes:
-            body['attributes'].update(additional_attributes)
-
-        self.request(url, method="POST", data=body)
-        print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} Created Host {db_host.hostname}")
+        _, headers = self.request(url, method="POST", data=body)
+        if not self.check_write('create', body['host_name'], headers):
+            return
+        print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} Created Host {body['host_name']}")
 
 #.
 #   .-- Create Cluster
-    def create_cluster(self, db_host, folder, labels, nodes, additional_attributes=None):
+    def create_cluster(self, body):
         """
         Create a not existing Cluster in CHeckmk
         """
         url = "/domain-types/host_config/collections/clusters"
-        body = {
-            'host_name' : db_host.hostname,
-            'folder' : '/' if not folder else folder,
-            'attributes': {
-                'labels' : labels,
-            },
-            'nodes' : nodes,
-        }
-        if additional_attributes:
-            body['attributes'].update(additional_attributes)
+        _, headers = self.request(url, method="POST", data=body)
+        if not self.check_write('create', body['host_name'], headers):
+            return
+        print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} Created Cluster {body['host_name']}")
 
-        self.request(url, method="POST", data=body)
-        print(f"{ColorCodes.OKGREEN} *{ColorCodes.ENDC} Created Cluster {db_host.hostname}")
+#.
+#   .-- Delete Host
+    def delete_host(self, hostname):
+        """
+        Delete the Host in Checkmk
+        """
+        url = f"objects/host_config/{hostname}"
+        _, status_code = self.request(url, method="DELETE")
+        if not self.check_write('delete', hostname, status_code):
+            return
+        print(f"{ColorCodes.WARNING} *{ColorCodes.ENDC} Deleted host {hostname}")
 
 #.
 #   .-- Get Etag
 
-    def get_etag(self, db_host):
+    def remember_etag(self, hostname, headers):
+        """
+        Keep the ETag of a write response for the next change of the host
+        """
+        if etag := headers.get('ETag'):
+            self.etags[hostname] = etag
+        else:
+            self.etags.pop(hostname, None)
+
+    def get_etag(self, hostname):
         """
-        Return ETAG of host
+        Return ETAG of host.
+        Taken from the last write response or the wildcard if enabled,
+        only otherwise read from Checkmk.
         """
+        if etag := self.etags.pop(hostname, None):
+            return etag
+        if app.config['CMK_ETAG_WILDCARD']:
+            return '*'
         print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Read ETAG in CMK")
-        url = f"objects/host_config/{db_host.hostname}"
+        url = f"objects/host_config/{hostname}"
         _, headers = self.request(url, "GET")
         return headers.get('ETag')
 
 #.
 #   .-- Update Cluster Nodes
-    def update_cluster_nodes(self, db_host, cmk_nodes, syncer_nodes):
+    def update_cluster_nodes(self, entry):
         """
-        Update the Nodes of Cluster in case of change
+        Update the Nodes of Cluster
         """
-        if cmk_nodes != syncer_nodes:
-            print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Cluster has new Nodes {syncer_nodes}")
-            etag = self.get_etag(db_host)
-            update_headers = {
-                'if-match': etag
-            }
-            update_url = f"/objects/host_config/{db_host.hostname}/properties/nodes"
-            update_body = {
-                'nodes': syncer_nodes
-            }
-            self.request(update_url, method="PUT",
-                data=update_body,
-                additional_header=update_headers)
+        hostname = entry['host_name']
+        print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Cluster {hostname} "\
+              f"gets new Nodes {entry['nodes']}")
+        update_headers = {
+            'if-match': self.get_etag(hostname)
+        }
+        update_url = f"/objects/host_config/{hostname}/properties/nodes"
+        update_body = {
+            'nodes': entry['nodes']
+        }
+        _, headers = self.request(update_url, method="PUT",
+            data=update_body,
+            additional_header=update_headers)
+        if not self.check_write('cluster update', hostname, headers):
+            return
+        self.remember_etag(hostname, headers)
 
 #.
 #   .-- Update Host
-    def update_host(self, db_host, cmk_host, folder, \
+    @staticmethod
+    def plan_update(plan, hostname, cmk_host, folder, \
                     labels, additional_attributes, remove_attributes):
         """
-        Update a Existing Host in Checkmk
+        Add the needed Move and Update of an Existing Host to the plan
         """
         current_folder = cmk_host['extensions']['folder']
         # Hack slash in front, quick solution before redesign
@@ -303,78 +735,89 @@ class SyncCMK2(CMK2):
 
         logger.debug(f"Checkmk Body: {cmk_host}")
 
-        etag = False
         # Check if we really need to move
         if current_folder != folder:
-            print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Host Moved to Folder: {folder}")
-            etag = self.get_etag(db_host)
-            update_headers = {
-                'if-match': etag
-            }
-            update_url = f"/objects/host_config/{db_host.hostname}/actions/move/invoke"
-            update_body = {
-                'target_folder': folder
-            }
-            _, header = self.request(update_url, method="POST",
-                         data=update_body,
-                         additional_header=update_headers)
-            # Need to update the header after last request
-            if new_etag := header.get('ETag'):
-                etag = new_etag
-            update_headers = {
-                'if-match': etag,
-            }
-            print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Moved Host from {current_folder}")
+            print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Host needs Move to Folder: {folder}")
+            plan['moves'].append({
+                'host_name': hostname,
+                'from': current_folder,
+                'target_folder': folder,
+            })
 
-        do_update = False
         update_reasons = []
         cmk_attributes = cmk_host['extensions']['attributes']
         cmk_labels = cmk_attributes.get('labels', {})
         if labels != cmk_labels:
-            do_update = True
             update_reasons.append("Labels not match")
 
         for key, value in additional_attributes.items():
             attr = cmk_attributes.get(key)
             if attr != value:
                 update_reasons.append(f"Update Extra Attribute: {key} Currently: {attr} != {value}")
-                do_update = True
                 break
         for attr in remove_attributes:
             if attr in cmk_attributes:
                 update_reasons.append(f"Remove Extra Attribute: {attr}")
-                do_update = True
                 break
 
-
-
-
-        if do_update:
-            # We may already got the Etag by the folder move action
-            if not etag:
-                etag = self.get_etag(db_host)
-
-            update_headers = {
-                'if-match': etag,
-            }
-            update_url = f"objects/host_config/{db_host.hostname}"
+        if update_reasons:
             update_body = {
+                'host_name': hostname,
                 'update_attributes': {
                     'labels' : labels,
-                }
+                },
+                'reasons': update_reasons,
             }
             if additional_attributes:
                 update_body['update_attributes'].update(additional_attributes)
 
             if remove_attributes:
                 update_body['remove_attributes'] = remove_attributes
-
-            logger.debug(f"Syncer Update Body: {update_body}")
-            self.request(update_url, method="PUT",
-                         data=update_body,
-                         additional_header=update_headers)
-            print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Updated Host in Checkmk")
+            print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Needs Update in Checkmk")
             print(f"   Reasons: {', '.join(update_reasons)}")
-            db_host.set_export_sync()
+            plan['updates'].append(update_body)
+
+    def move_host(self, entry):
+        """
+        Move the Host to its new Folder
+        """
+        hostname = entry['host_name']
+        update_headers = {
+            'if-match': self.get_etag(hostname)
+        }
+        update_url = f"/objects/host_config/{hostname}/actions/move/invoke"
+        update_body = {
+            'target_folder': entry['target_folder']
+        }
+        _, header = self.request(update_url, method="POST",
+                     data=update_body,
+                     additional_header=update_headers)
+        if not self.check_write('move', hostname, header):
+            return
+        # Need to update the header after last request
+        self.remember_etag(hostname, header)
+        print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Moved Host {hostname} "\
+              f"from {entry['from']} to {entry['target_folder']}")
+
+    def update_host(self, entry):
+        """
+        Update a Existing Host in Checkmk
+        """
+        hostname = entry['host_name']
+        # We may already got the Etag by the folder move action
+        update_headers = {
+            'if-match': self.get_etag(hostname),
+        }
+        update_url = f"objects/host_config/{hostname}"
+        update_body = {k: v for k, v in entry.items() if k != 'host_name'}
+        logger.debug(f"Syncer Update Body: {update_body}")
+        _, headers = self.request(update_url, method="PUT",
+                                  data=update_body,
+                                  additional_header=update_headers)
+        if not self.check_write('update', hostname, headers):
+            return
+        self.remember_etag(hostname, headers)
+        print(f"{ColorCodes.OKBLUE} *{ColorCodes.ENDC} Updated Host {hostname}")
+        Host.touch_export([hostname])
 
 #.
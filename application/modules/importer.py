@@ -0,0 +1,140 @@
+"""
+Shared Import Pipeline for the Host Sources
+"""
+#pylint: disable=too-few-public-methods, no-member
+from pymongo import UpdateOne
+from mongoengine.errors import ValidationError
+from application import app, logger
+from application.models.host import Host, HostError
+from application.modules.debug import ColorCodes
+
+
+class HostImporter():
+    """
+    Collect the Hosts of an Import and write them in Batches.
+    Existing Hosts of a Batch are fetched with one Query,
+    all Changes are written with one bulk_write.
+
+    Example:
+        importer = HostImporter(account_dict=account)
+        for hostname, labels in data:
+            importer.add(hostname, labels)
+        importer.finish()
+    """
+
+    def __init__(self, account_id=False, account_name=False, account_dict=False,
+                 batch_size=None):
+        """
+        Account params are passed to Host.set_account()
+
+        Args:
+            account_id (string): Legacy: Id of the Source
+            account_name (string): Legacy: Name of the Source
+            account_dict (dict): Full Account Information
+            batch_size (int): Hosts per Batch, default is IMPORT_BATCH_SIZE
+        """
+        if not account_id and not account_dict:
+            raise ValueError("Either Set account_id or pass account_dict")
+        self.account_id = account_id
+        self.account_name = account_name
+        self.account_dict = account_dict
+        self.batch_size = batch_size or app.config.get('IMPORT_BATCH_SIZE', 500)
+        self.pending = []
+        self.stats = {
+            'updated': 0,
+            'skipped': 0,
+        }
+
+    def add(self, hostname, labels):
+        """
+        Add Host with its new Labels to the Import
+
+        Args:
+            hostname (string): Name of the Host
+            labels (dict): Key:Value pairs of labels
+        """
+        self.pending.append((hostname, labels))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def _handle_host(self, host_obj, labels):
+        """
+        Apply the Import to the Host Object.
+        Returns the names of the changed Fields, or False if the Host is owned
+        by another Account or not valid.
+        """
+        fields = {'available', 'last_import_seen'}
+        if host_obj.get_labels() != labels:
+            host_obj.set_import_sync()
+            host_obj.set_labels(labels)
+            fields.update(['labels', 'last_import_sync', 'last_change', 'cache'])
+        host_obj.set_import_seen()
+
+        try:
+            if self.account_dict:
+                if not host_obj.set_account(account_dict=self.account_dict):
+                    raise HostError("Not the master")
+            else:
+                host_obj.set_account(self.account_id, self.account_name)
+        except HostError as error:
+            logger.debug(f"{host_obj.hostname}: {error}")
+            print(f" {ColorCodes.WARNING} * {ColorCodes.ENDC} "\
+                  f"{host_obj.hostname} managed by diffrent master")
+            return False
+        fields.update(['source_account_id', 'source_account_name'])
+
+        if not host_obj.pk:
+            # bulk_write skips the Validation of save()
+            try:
+                host_obj.validate()
+            except ValidationError as error:
+                print(f" {ColorCodes.FAIL} * {ColorCodes.ENDC} "\
+                      f"{host_obj.hostname} not valid: {error}")
+                return False
+        return fields
+
+    def flush(self):
+        """
+        Write the pending Hosts to the Database
+        """
+        if not self.pending:
+            return
+        hostnames = [x[0] for x in self.pending]
+        existing = {x.hostname: x for x in Host.objects(hostname__in=hostnames)\
+                        .only('hostname', 'labels', 'source_account_id', 'source_account_name')}
+
+        # In case a Host is in the batch more then once,
+        # the last state wins and all changed fields are written
+        changes = {}
+        for hostname, labels in self.pending:
+            if hostname not in existing:
+                new_host = Host()
+                new_host.hostname = hostname
+                existing[hostname] = new_host
+            host_obj = existing[hostname]
+            fields = self._handle_host(host_obj, labels)
+            if not fields:
+                self.stats['skipped'] += 1
+                continue
+            changes.setdefault(hostname, set())
+            changes[hostname].update(fields)
+
+        operations = []
+        for hostname, fields in changes.items():
+            host_obj = existing[hostname]
+            update = {field: host_obj[field] for field in fields}
+            operations.append(UpdateOne({'hostname': hostname}, {'$set': update}, upsert=True))
+        if operations:
+            logger.debug(f"Write {len(operations)} Hosts")
+            Host._get_collection().bulk_write(operations, ordered=False) #pylint: disable=protected-access
+            self.stats['updated'] += len(operations)
+        self.pending = []
+
+    def finish(self):
+        """
+        Write the rest and print a Summary
+        """
+        self.flush()
+        print(f"{ColorCodes.OKBLUE}Done {ColorCodes.ENDC}"\
+              f"{self.stats['updated']} Hosts written, "\
+              f"{self.stats['skipped']} skipped (diffrent master or not valid)")
@@ -2,6 +2,7 @@
 Create Objects in Netbox
 """
 #pylint: disable=no-member, too-many-locals, import-error
+from urllib.parse import quote
 import requests
 
 from application.models.host import Host
@@ -100,15 +101,17 @@ class SyncNetbox(Plugin):
             return {}
 #.
 #   .-- Get Devices
-    def get_devices(self, syncer_only=False):
+    def get_devices(self, syncer_only=False, names=None):
         """
-        Read full list of devices
+        Read full list of devices, or only the given names
         """
         print(f"{CC.OKGREEN} -- {CC.ENDC}Netbox: "\
               f"Read all devices (Filter only CMDB Syncer: {syncer_only})")
         url = 'dcim/devices/?limit=1000'
         if syncer_only:
             url += f"&cf_cmdbsyncer_id={self.config['_id']}"
+        if names:
+            url += "".join(f"&name={quote(x)}" for x in names)
         devices = self.request(url, "GET")
         return {x['display']:x for x in devices}
 #.
@@ -425,19 +428,24 @@ class SyncNetbox(Plugin):
         print(f"{CC.OKGREEN} *{CC.ENDC} Check Sync of Interfaces")
 #.
 #   .--- Export Hosts
-    def export_hosts(self):
+    def export_hosts(self, limit=None):
         """
         Update Devices Table in Netbox
+
+        Args:
+            limit (list): Only export these Hosts, no cleanup is done then
         """
-        #pylint: disable=too-many-locals
-        current_netbox_devices = self.get_devices(syncer_only=True)
+        #pylint: disable=too-many-locals, too-many-branches
+        current_netbox_devices = self.get_devices(syncer_only=True, names=limit)
 
         print(f"\n{CC.OKGREEN} -- {CC.ENDC}Start Sync")
-        db_objects = Host.objects(available=True)
-        total = len(db_objects)
+        filters = {'available': True}
+        if limit:
+            filters['hostname__in'] = limit
+        total = Host.objects(**filters).count()
         counter = 0
         found_hosts = []
-        for db_host in db_objects:
+        for db_host in Host.iter_hosts(exclude=['raw', 'log'], paged=True, **filters):
             hostname = db_host.hostname
             counter += 1
 
@@ -477,6 +485,9 @@ class SyncNetbox(Plugin):
             if 'update_interfaces' in custom_rules:
                 self.update_interfaces(host_netbox_id, all_attributes['all'])
 
+        if limit:
+            print(f"\n{CC.OKGREEN} -- {CC.ENDC}Stop processing in limit mode")
+            return
         print(f"\n{CC.OKGREEN} -- {CC.ENDC}Cleanup")
         for hostname, host_data in current_netbox_devices.items():
             if hostname not in found_hosts:
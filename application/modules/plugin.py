@@ -2,8 +2,9 @@
 Alle Stuff shared by the plugins
 """
 #pylint: disable=too-few-public-methods
+import hashlib
 
-from application import app, logger
+from application import logger
 from application.modules.custom_attributes.models import CustomAttributeRule as CustomAttributeRuleModel
 from application.modules.custom_attributes.rules import CustomAttributeRule
 
@@ -22,29 +23,58 @@ class Plugin():
 
     def init_custom_attributes(self):
         """
-        Load Rules for custom Attributes
+        Load Rules for custom Attributes.
+        Called once per Plugin instance, the compiled Rules are used for all Hosts
         """
         self.custom_attributes = CustomAttributeRule()
         self.custom_attributes.debug = self.debug
         self.custom_attributes.rules = \
                         CustomAttributeRuleModel.objects(enabled=True).order_by('sort_field')
 
+    def get_attributes_version(self):
+        """
+        Version of all Rules the Host Attributes are built with.
+        Changes as soon one of these Rules is changed.
+        """
+        versions = [self.custom_attributes.version]
+        for rules in (self.rewrite, self.filter):
+            versions.append(rules.version if rules else "")
+        return hashlib.sha1(":".join(versions).encode('utf-8')).hexdigest()
+
+    def get_attributes_cache_key(self):
+        """
+        Name of the Cache Entry for the Host Attributes.
+        Exports sharing a Cache Group, but not the Rules,
+        get their own Entry. Otherwise they replace the Entry
+        of each other on every run.
+        """
+        key = 'attributes'
+        if self.rewrite:
+            key += '_rewrite'
+        if self.filter:
+            key += '_filter'
+        return key
+
     def get_host_attributes(self, db_host, cache):
         """
         Return Host Attributes or False if Host should be ignored
         """
+        if not self.custom_attributes:
+            self.init_custom_attributes()
+        version = self.get_attributes_version()
+        cache_key = self.get_attributes_cache_key()
+
         # Get Attributes
-        db_host.cache.setdefault(cache, {})
-        if 'attributes' in db_host.cache[cache]:
+        cached = db_host.get_cache_entry(cache, cache_key, version)
+        if cached is not None:
             logger.debug(f"Using Cache for {db_host.hostname}")
-            if 'ignore_host' in db_host.cache[cache]['attributes']['filtered']:
+            if 'ignore_host' in cached['filtered']:
                 return False
-            return db_host.cache[cache]['attributes']
+            return cached
         attributes = {}
         attributes.update(db_host.labels)
         attributes.update(db_host.inventory)
 
-        self.init_custom_attributes()
         attributes.update(self.custom_attributes.get_outcomes(db_host, attributes))
 
         attributes_filtered = {}
@@ -64,10 +94,8 @@ class Plugin():
             attributes_filtered = self.filter.get_outcomes(db_host, attributes)
             data['filtered'] = attributes_filtered
             if attributes_filtered.get('ignore_host'):
-                db_host.cache[cache]['attributes'] = data
-                db_host.save()
+                db_host.set_cache_entry(cache, cache_key, data, version)
                 return False
 
-        db_host.cache[cache]['attributes'] = data
-        db_host.save()
+        db_host.set_cache_entry(cache, cache_key, data, version)
         return data
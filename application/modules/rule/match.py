@@ -3,6 +3,10 @@
 Helper To match condtions
 """
 import re
+from functools import lru_cache
+
+# Max number of prepared needles (compiled regex, in_list sets) kept
+NEEDLE_CACHE_SIZE = 4096
 
 
 # pylint: disable=inconsistent-return-statements
@@ -20,6 +24,36 @@ def make_bool(value):
         return False
 
 
+@lru_cache(maxsize=NEEDLE_CACHE_SIZE)
+def prepare_needle(condition, needle):
+    """
+    Return the needle in the form the condition compares against.
+    Cached, so regex compile or list split only happens once per needle
+
+    Args:
+        condition (string): Condition Type
+        needle (string): Needle as configured in the rule
+    """
+    if condition == 'bool':
+        return make_bool(needle)
+    needle = str(needle).lower()
+    if condition == 'regex':
+        return re.compile(needle)
+    if condition == 'in_list':
+        return frozenset(x.strip() for x in needle.split(','))
+    return needle
+
+
+def needle_cache_info():
+    """
+    Return Hit Ratio and Size of the needle cache as String
+    """
+    info = prepare_needle.cache_info() #pylint: disable=no-value-for-parameter
+    total = info.hits + info.misses
+    ratio = 100.0 * info.hits / total if total else 0
+    return f"{info.hits}/{total} hits ({ratio:.0f}%), {info.currsize} needles"
+
+
 def match(value, needle, condition, negate=False):
     """
     Check for Match for given params
@@ -32,12 +66,11 @@ def match(value, needle, condition, negate=False):
     if condition == 'ignore':
         return True
 
+    needle = prepare_needle(condition, needle)
     if condition == 'bool':
         value = make_bool(value)
-        needle = make_bool(needle)
     else:
         value = str(value).lower()
-        needle = str(needle).lower()
 
     if negate:
         if condition == 'equal':
@@ -47,7 +80,7 @@ def match(value, needle, condition, negate=False):
             if needle not in value:
                 return True
         elif condition == 'in_list':
-            if value not in [x.strip() for x in needle.split(',')]:
+            if value not in needle:
                 return True
         elif condition == 'swith':
             if not value.startswith(needle):
@@ -56,8 +89,7 @@ def match(value, needle, condition, negate=False):
             if not value.endswith(needle):
                 return True
         elif condition == 'regex':
-            pattern = re.compile(needle) #@TODO Cache
-            if not pattern.match(value):
+            if not needle.match(value):
                 return True
         elif condition == 'bool':
             if needle != value:
@@ -72,7 +104,7 @@ def match(value, needle, condition, negate=False):
         if needle in value:
             return True
     elif condition == 'in_list':
-        if value in [x.strip() for x in needle.split(',')]:
+        if value in needle:
             return True
     elif condition == 'swith':
         if value.startswith(needle):
@@ -81,8 +113,7 @@ def match(value, needle, condition, negate=False):
         if value.endswith(needle):
             return True
     elif condition == 'regex':
-        pattern = re.compile(needle)
-        if pattern.match(value):
+        if needle.match(value):
             return True
     elif condition == 'bool':
         if needle == value:
@@ -3,52 +3,197 @@
 Handle Rule Matching
 """
 # pylint: disable=import-error
+import hashlib
+import json
+from bisect import bisect_left
 from rich.console import Console
 from rich.table import Table
 from rich import box
 
-from application.modules.rule.match import match
+from application.modules.rule.match import match, prepare_needle
+
+# Relative costs of the condition types.
+# Used to evaluate the cheap conditions of a rule first
+CONDITION_COSTS = {
+    'ignore': 0,
+    'equal': 1,
+    'in_list': 1,
+    'bool': 2,
+    'swith': 2,
+    'ewith': 2,
+    'in': 3,
+    'regex': 5,
+}
+# Attribute conditions need to look at the attributes of the host,
+# so they are always more expensive then hostname conditions
+ATTRIBUTE_CONDITION_COST = 10
+
+class RuleCondition(): # pylint: disable=too-few-public-methods, too-many-instance-attributes
+    """
+    Prebuilt Matcher for a single Rule Condition.
+    Needles are normalized once when the Rule is loaded.
+    """
+
+    def __init__(self, condition):
+        """
+        Build from Condition dict (as returned by to_mongo())
+        """
+        self.match_type = condition.get('match_type')
+        if self.match_type == 'tag':
+            self.tag = condition.get('tag')
+            self.tag_match = condition.get('tag_match')
+            self.tag_match_negate = condition.get('tag_match_negate')
+            self.value = condition.get('value')
+            self.value_match = condition.get('value_match')
+            self.value_match_negate = condition.get('value_match_negate')
+            self.cost = ATTRIBUTE_CONDITION_COST \
+                        + CONDITION_COSTS.get(self.tag_match, 5) \
+                        + CONDITION_COSTS.get(self.value_match, 5)
+        else:
+            self.hostname = str(condition.get('hostname')).lower()
+            self.hostname_match = str(condition.get('hostname_match')).lower()
+            self.hostname_match_negate = condition.get('hostname_match_negate')
+            self.cost = CONDITION_COSTS.get(self.hostname_match, 5)
+
+
+class CompiledRule(): # pylint: disable=too-few-public-methods
+    """
+    Rule Document converted once into everything check_rules needs
+    """
+
+    def __init__(self, rule, reorder_conditions=False):
+        """
+        Build from Rule Document
+
+        Args:
+            rule (Document): Rule Document
+            reorder_conditions (bool): Sort Conditions, cheapest first
+        """
+        rule = rule.to_mongo()
+        self.checksum = hashlib.sha1(json.dumps(rule, sort_keys=True, default=str)\
+                                        .encode('utf-8')).hexdigest()
+        self.rule_id = rule['_id']
+        self.name = rule['name']
+        self.condition_typ = rule['condition_typ']
+        self.last_match = rule.get('last_match', False)
+        self.conditions = [RuleCondition(x) for x in rule.get('conditions', [])]
+        if reorder_conditions:
+            # Result is the same in every order, but with short-circuit
+            # evaluation we can skip the expensive ones more often
+            self.conditions.sort(key=lambda x: x.cost)
+        self.outcomes = [dict(x) for x in rule.get('outcomes', [])]
+
+
+class AttributeIndex():
+    """
+    Index over the Attribute Names of a Host.
+    Built once per Host evaluation and used by all Rules of the set.
+    """
+
+    def __init__(self, attributes):
+        """
+        Group Attribute Values by lowercase Attribute Name
+        """
+        self.attributes = attributes
+        self.by_name = {}
+        for name, value in attributes.items():
+            self.by_name.setdefault(str(name).lower(), []).append(value)
+        self._sorted_names = None
+
+    @property
+    def sorted_names(self):
+        """
+        Sorted Attribute Names, only built if needed for prefix lookups
+        """
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.by_name)
+        return self._sorted_names
+
+    def get_values(self, name_match, needle, negate):
+        """
+        Yield Values of all Attributes which Name match the condition.
+        equal, in_list and swith are looked up directly,
+        everything else needs to check all Attribute Names.
+        """
+        if not negate and name_match in ('equal', 'in_list', 'swith'):
+            needle = prepare_needle(name_match, needle)
+            if name_match == 'equal':
+                yield from self.by_name.get(needle, [])
+            elif name_match == 'in_list':
+                for name in needle:
+                    yield from self.by_name.get(name, [])
+            else:
+                names = self.sorted_names
+                for idx in range(bisect_left(names, needle), len(names)):
+                    if not names[idx].startswith(needle):
+                        break
+                    yield from self.by_name[names[idx]]
+            return
+        for name, value in self.attributes.items():
+            if match(name, needle, name_match, negate):
+                yield value
+
 
 class Rule(): # pylint: disable=too-few-public-methods
     """
     Base Rule Class
     """
     debug = False
-    rules = []
+    reorder_conditions = True
+    _rules = []
+    version = ""
     name = ""
     attributes = {}
+    _attribute_index = None
+
+    @property
+    def rules(self):
+        """
+        Compiled Rules
+        """
+        return self._rules
+
+    @rules.setter
+    def rules(self, rules):
+        """
+        Compile the given Rule Documents once,
+        so that check_rules don't need to convert them for every host.
+        Also sets the version, a checksum over the content of all Rules.
+        """
+        self._rules = [CompiledRule(x, self.reorder_conditions) for x in rules]
+        self.version = hashlib.sha1(":".join(x.checksum for x in self._rules)\
+                                        .encode('utf-8')).hexdigest()
 
     def _check_attribute_match(self, condition):
         """
         Check if on of the given attributes match the rule
         """
-        needed_tag = condition['tag']
-        tag_match = condition['tag_match']
-        tag_match_negate = condition['tag_match_negate']
+        needed_tag = condition.tag
+        tag_match = condition.tag_match
+        tag_match_negate = condition.tag_match_negate
+
+        needed_value = condition.value
+        value_match = condition.value_match
+        value_match_negate = condition.value_match_negate
 
-        needed_value = condition['value']
-        value_match = condition['value_match']
-        value_match_negate = condition['value_match_negate']
+        if self._attribute_index is None:
+            self._attribute_index = AttributeIndex(self.attributes)
 
         # Wee need to find out if tag AND tag value match
-        for tag, value in self.attributes.items():
-            # Check if Tag matchs
-            if match(tag, needed_tag, tag_match, tag_match_negate):
-                # Tag Match, see if Value Match
-                if match(value, needed_value, value_match, value_match_negate):
-                    return True
+        for value in self._attribute_index.get_values(tag_match, needed_tag, tag_match_negate):
+            # Tag Match, see if Value Match
+            if match(value, needed_value, value_match, value_match_negate):
+                return True
         return False
 
     @staticmethod
     def _check_hostname_match(condition, hostname):
         """
         Check if Condition Matchs to Hostname
+        Hostname needs to be lowercase already
         """
-        needed = condition['hostname'].lower()
-        host_match = condition['hostname_match'].lower()
-        negate = condition['hostname_match_negate']
-
-        if match(hostname.lower(), needed, host_match, negate):
+        if match(hostname, condition.hostname,
+                 condition.hostname_match, condition.hostname_match_negate):
             return True
         return False
 
@@ -75,40 +220,42 @@ class Rule(): # pylint: disable=too-few-public-methods
             table.add_column("Rule ID")
             table.add_column("Last Match")
 
+        lower_hostname = hostname.lower()
         outcomes = {}
         for rule in self.rules:
-            rule = rule.to_mongo()
             rule_hit = False
-            if rule['condition_typ'] == 'any':
-                for condtion in rule['conditions']:
-                    local_hit = False
-                    if condtion['match_type'] == 'tag':
+            if rule.condition_typ == 'any':
+                for condtion in rule.conditions:
+                    if condtion.match_type == 'tag':
                         local_hit = self._check_attribute_match(condtion)
                     else:
-                        local_hit = self._check_hostname_match(condtion, hostname)
+                        local_hit = self._check_hostname_match(condtion, lower_hostname)
                     if local_hit:
+                        # One hit is enough
                         rule_hit = True
-            elif rule['condition_typ'] == 'all':
-                negativ_match = False
-                for condtion in rule['conditions']:
-                    if condtion['match_type'] == 'tag':
-                        if not self._check_attribute_match(condtion):
-                            negativ_match = True
+                        break
+            elif rule.condition_typ == 'all':
+                rule_hit = True
+                for condtion in rule.conditions:
+                    if condtion.match_type == 'tag':
+                        local_hit = self._check_attribute_match(condtion)
                     else:
-                        if not self._check_hostname_match(condtion, hostname):
-                            negativ_match = True
-                if not negativ_match:
-                    rule_hit = True
-            elif rule['condition_typ'] == 'anyway':
+                        local_hit = self._check_hostname_match(condtion, lower_hostname)
+                    if not local_hit:
+                        # One miss is enough
+                        rule_hit = False
+                        break
+            elif rule.condition_typ == 'anyway':
                 rule_hit = True
 
             if self.debug:
-                table.add_row(str(rule_hit), rule_descriptions[rule['condition_typ']],\
-                              rule['name'][:30], str(rule['_id']), str(rule['last_match']))
+                table.add_row(str(rule_hit), rule_descriptions[rule.condition_typ],\
+                              rule.name[:30], str(rule.rule_id), str(rule.last_match))
             if rule_hit:
-                outcomes = self.add_outcomes([dict(x) for x in rule['outcomes']], outcomes)
+                # Copy, since the plugins are allowed to modify the outcomes
+                outcomes = self.add_outcomes([dict(x) for x in rule.outcomes], outcomes)
                 # If rule has matched, and option is set, we are done
-                if rule['last_match']:
+                if rule.last_match:
                     break
         if self.debug:
             console = Console()
@@ -136,4 +283,6 @@ class Rule(): # pylint: disable=too-few-public-methods
         Handle Return of outcomes.
         """
         self.attributes = attributes
+        # Index is built on first use with the new attributes
+        self._attribute_index = None
         return self.check_rule_match(db_host)
@@ -241,15 +241,15 @@ def debug_ansible_rules(hostname):
 #.
 #   .-- Ansible Cache
 
-def _inner_udpate_cache():
+def _inner_udpate_cache(limit=None):
     """
     Update Cache of Ansible
     """
     print(f"{ColorCodes.OKGREEN}Delete current Cache{ColorCodes.ENDC}")
-    for host in Host.objects():
-        if 'ansible' in host.cache:
-            del host.cache['ansible']
-            host.save()
+    query = Host.objects(cache__ansible__exists=True)
+    if limit:
+        query = query.filter(hostname__in=limit)
+    query.update(unset__cache__ansible=True)
     print(f"{ColorCodes.OKGREEN}Build new Cache{ColorCodes.ENDC}")
     rules = load_rules()
     syncer = SyncAnsible()
@@ -257,21 +257,27 @@ def _inner_udpate_cache():
     syncer.rewrite = rules['rewrite']
     syncer.actions = rules['actions']
     # Do the action which triggers the caches
-    syncer.get_full_inventory()
+    syncer.get_full_inventory(limit)
 
 @cli_ansible.command('update_cache')
-def update_cache():
+@click.option("--limit", default='')
+def update_cache(limit):
     """
     Update Cache for Ansible
+
+    Args:
+        limit (list): Comma separted list of Hosts
     """
-    _inner_udpate_cache()
+    limit_list = [x.strip() for x in limit.split(',') if x]
+    _inner_udpate_cache(limit_list)
 
 #.
 #   .-- Ansible Source
 @cli_ansible.command('source')
 @click.option("--list", is_flag=True)
 @click.option("--host")
-def source(list, host): #pylint: disable=redefined-builtin
+@click.option("--limit", default='')
+def source(list, host, limit): #pylint: disable=redefined-builtin
     """Inventory Source for Ansible"""
     #pylint: disable=no-else-return
     rules = load_rules()
@@ -281,7 +287,8 @@ def source(list, host): #pylint: disable=redefined-builtin
     syncer.actions = rules['actions']
 
     if list:
-        print(json.dumps(syncer.get_full_inventory()))
+        limit_list = [x.strip() for x in limit.split(',') if x]
+        print(json.dumps(syncer.get_full_inventory(limit_list)))
         return True
     elif host:
         print(json.dumps(syncer.get_host_inventory(host)))
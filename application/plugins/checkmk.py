@@ -3,9 +3,13 @@ Commands to handle Checkmk Sync
 """
 #pylint: disable=too-many-arguments, too-many-statements, consider-using-get, no-member
 
+import contextlib
+import json
+import sys
 import click
 from mongoengine.errors import DoesNotExist
 from application.modules.checkmk.syncer import SyncCMK2
+from application.modules.checkmk.catalog import AttributeCatalog
 from application.modules.checkmk.cmk2 import cli_cmk, CmkException
 from application.helpers.get_account import get_account_by_name
 from application.helpers.cron import register_cronjob
@@ -63,7 +67,7 @@ def show_hosts(disabled_only=False):
     syncer.actions = rules['actions']
 
 
-    for db_host in Host.objects(available=True):
+    for db_host in Host.iter_hosts(exclude=['raw', 'log'], available=True):
         attributes = syncer.get_host_attributes(db_host, 'checkmk')
         if not attributes:
             if disabled_only:
@@ -87,35 +91,54 @@ def show_labels():
     syncer.rewrite = rules['rewrite']
     syncer.actions = rules['actions']
 
-    outcome = []
-    for db_host in Host.objects(available=True):
-        attributes = syncer.get_host_attributes(db_host, 'checkmk')
-        if not attributes:
-            continue
-
-        for key, value in attributes['filtered'].items():
-            if (key, value) not in outcome:
-                outcome.append((key, value))
-
-    for key, value in outcome:
-        print(f"{key}:{value}")
+    catalog = AttributeCatalog(syncer, 'checkmk', field='filtered').load()
+    for key, values in catalog.keys.items():
+        for value in values:
+            print(f"{key}:{value}")
 #.
 #   .-- Command: Export Hosts
 
-def _inner_export_hosts(account, limit=False):
+def _inner_export_hosts(account, limit=False, *, workers=1, bulk_size=None,
+                        dry_run=False, plan_file=None, apply_plan=None, full_compare=False):
     try:
         target_config = get_account_by_name(account)
         if target_config:
             rules = _load_rules()
             syncer = SyncCMK2()
+            syncer.account = target_config['_id']
             syncer.account_id = str(target_config['_id'])
             syncer.account_name = target_config['name']
             syncer.limit = limit
+            syncer.workers = workers
+            syncer.bulk_size = bulk_size
+            syncer.full_compare = full_compare
             syncer.config = target_config
             syncer.filter = rules['filter']
             syncer.rewrite = rules['rewrite']
             syncer.actions = rules['actions']
-            syncer.run()
+            if apply_plan:
+                with open(apply_plan, encoding='utf-8') as plan_fh:
+                    plan = json.load(plan_fh)
+                if plan['account'] != syncer.account_name:
+                    print(f"{ColorCodes.FAIL} Plan is for Account {plan['account']} "\
+                          f"{ColorCodes.ENDC}")
+                    return
+                syncer.apply_plan(plan)
+                return
+            if dry_run and not plan_file:
+                # Keep stdout for the JSON of the plan
+                with contextlib.redirect_stdout(sys.stderr):
+                    plan = syncer.run(dry_run=True)
+            else:
+                plan = syncer.run(dry_run=dry_run)
+            if dry_run:
+                if plan_file:
+                    with open(plan_file, 'w', encoding='utf-8') as plan_fh:
+                        json.dump(plan, plan_fh, indent=2)
+                    print(f"{ColorCodes.OKGREEN} -- {ColorCodes.ENDC}Plan saved to {plan_file}: "\
+                          f"{syncer.get_plan_summary(plan)}")
+                else:
+                    print(json.dumps(plan, indent=2))
 
         else:
             print(f"{ColorCodes.FAIL} Config not found {ColorCodes.ENDC}")
@@ -126,21 +149,49 @@ def _inner_export_hosts(account, limit=False):
 @cli_cmk.command('export_hosts')
 @click.argument("account")
 @click.option("--limit", default='')
+@click.option("--workers", default=1, type=int)
+@click.option("--bulk-size", default=None, type=int)
+@click.option("--dry-run", default=False, is_flag=True)
+@click.option("--plan-file", default=None)
+@click.option("--apply-plan", default=None, type=click.Path(exists=True))
+@click.option("--full-compare", default=False, is_flag=True)
 #@click.option("--debug", default=False, is_flag=True)
-def export_hosts(account, limit):
+def export_hosts(account, limit, *, workers, bulk_size, dry_run, plan_file, apply_plan,
+                 full_compare):
     """
     ## Export Hosts to Checkmk
 
     ### Example
-    _./cmdbsyncer checkmk export_hosts SITEACCOUNT_
+    _./cmdbsyncer checkmk export_hosts SITEACCOUNT --workers 16_
+
+    _./cmdbsyncer checkmk export_hosts SITEACCOUNT --dry-run --plan-file plan.json_
+
+    _./cmdbsyncer checkmk export_hosts SITEACCOUNT --apply-plan plan.json_
 
     Args:
         account (string): Name Account Config
         limit (list): Comma separted list of Hosts
+        workers (int): Parallel API calls for host moves, creates, updates and deletes,
+                       also for the bulk requests and their fallback.
+                       CMK_POOL_SIZE should be at least that big.
+        bulk_size (int): Hosts per bulk create/update/delete request,
+                         0 for single requests. Default: CMK_BULK_SIZE
+        dry_run (bool): Only plan the changes, print them as JSON to stdout.
+                        Checkmk and the Folder Pools are not changed,
+                        the Pool Seats are taken once the plan is applied
+        plan_file (string): Save the plan of the dry run to this file
+        apply_plan (string): Apply a saved plan instead of planning again
+        full_compare (bool): Compare all hosts with Checkmk, also the ones unchanged
+                             since their last export. Run it from time to time,
+                             to catch changes made in Checkmk directly, and to
+                             delete hosts which were removed from the Database directly.
+                             Done anyway after CMK_HOST_FULL_COMPARE_AGE hours
     """
 
     limit_list = [x.strip() for x in limit.split(',') if x]
-    _inner_export_hosts(account, limit_list)
+    _inner_export_hosts(account, limit_list, workers=workers, bulk_size=bulk_size,
+                        dry_run=dry_run, plan_file=plan_file, apply_plan=apply_plan,
+                        full_compare=full_compare)
 #.
 #   .-- Command: Host Debug
 @cli_cmk.command('debug_host')
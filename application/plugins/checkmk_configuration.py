@@ -133,7 +133,8 @@ def cli_inventorize_hosts(account):
 
 @cli_cmk.command('export_bi_rules')
 @click.argument("account")
-def cli_export_bi_rules(account):
+@click.option("--full-compare", default=False, is_flag=True)
+def cli_export_bi_rules(account, full_compare):
     """
     Export all BI Rules to given Checkmk Installations
 
@@ -143,13 +144,16 @@ def cli_export_bi_rules(account):
 
     Args:
         account (string): Name Account Config
+        full_compare (bool): Read all Rules from Checkmk and revert changes made there.
+                             Done anyway after CMK_BI_FULL_COMPARE_AGE hours
     """
-    export_bi_rules(account)
+    export_bi_rules(account, full_compare)
 
 #.
 @cli_cmk.command('export_bi_aggregations')
 @click.argument("account")
-def cli_export_bi_aggregations(account):
+@click.option("--full-compare", default=False, is_flag=True)
+def cli_export_bi_aggregations(account, full_compare):
     """
     Export all BI Aggregations to given Checkmk Installations
 
@@ -159,8 +163,10 @@ def cli_export_bi_aggregations(account):
 
     Args:
         account (string): Name Account Config
+        full_compare (bool): Read all Aggregations from Checkmk and revert changes made there.
+                             Done anyway after CMK_BI_FULL_COMPARE_AGE hours
     """
-    export_bi_aggregations(account)
+    export_bi_aggregations(account, full_compare)
 #.
 
 register_cronjob('Checkmk: Export Rules', export_rules)
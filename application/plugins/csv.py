@@ -7,6 +7,7 @@ import click
 from application import app
 from application.models.host import Host
 from application.modules.plugin import Plugin
+from application.modules.importer import HostImporter
 from application.modules.debug import ColorCodes
 from application.helpers.get_account import get_account_by_name
 from application.helpers.cron import register_cronjob
@@ -74,6 +75,10 @@ def import_hosts(csv_path, delimiter, hostname_field, account):
     filename = csv_path.split('/')[-1]
     print(f"{ColorCodes.OKBLUE}Started {ColorCodes.ENDC}"\
           f"{ColorCodes.UNDERLINE}{filename}{ColorCodes.ENDC}")
+    if account:
+        importer = HostImporter(account_dict=account)
+    else:
+        importer = HostImporter(f"csv_{filename}", filename)
     with open(csv_path, newline='', encoding='utf-8') as csvfile:
         reader = csv.DictReader(csvfile, delimiter=delimiter)
         for row in reader:
@@ -83,20 +88,9 @@ def import_hosts(csv_path, delimiter, hostname_field, account):
                 if not row[dkey]:
                     del row[dkey]
             print(f" {ColorCodes.OKGREEN}** {ColorCodes.ENDC} Update {hostname}")
-            host_obj = Host.get_host(hostname)
             del row[hostname_field]
-            if host_obj.get_labels() != row:
-                host_obj.set_import_sync()
-                host_obj.set_labels(row)
-            host_obj.set_import_seen()
-            if account:
-                do_save = host_obj.set_account(account_dict=account)
-            else:
-                do_save = True
-                host_obj.set_account(f"csv_{filename}", filename)
-
-            if do_save:
-                host_obj.save()
+            importer.add(hostname, row)
+    importer.finish()
 
 @_cli_csv.command('import_hosts')
 @click.argument("csv_path", default=False)
@@ -5,7 +5,7 @@ JSON Plugin
 import json
 import click
 from application import app
-from application.models.host import Host
+from application.modules.importer import HostImporter
 from application.modules.debug import ColorCodes
 from application.helpers.get_account import get_account_by_name
 
@@ -38,19 +38,12 @@ def import_hosts(json_path, hostname_field, account):
     print(f"{ColorCodes.OKBLUE}Started {ColorCodes.ENDC}"\
           f"{ColorCodes.UNDERLINE}{filename}{ColorCodes.ENDC}")
 
+    importer = HostImporter(account_dict=account)
     with open(json_path, newline='', encoding='utf-8') as json_file:
         data = json.load(json_file)
         for host in data:
             hostname = host[hostname_field]
             print(f" {ColorCodes.OKGREEN}** {ColorCodes.ENDC} Update {hostname}")
             del host[hostname_field]
-            host_obj = Host.get_host(hostname)
-            if host_obj.get_labels() != host:
-                host_obj.set_import_sync()
-                host_obj.set_labels(host)
-            host_obj.set_import_seen()
-
-            do_save = host_obj.set_account(account_dict=account)
-
-            if do_save:
-                host_obj.save()
+            importer.add(hostname, host)
+    importer.finish()
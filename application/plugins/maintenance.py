@@ -14,7 +14,9 @@ from application.modules.debug import ColorCodes
 from application.modules.checkmk.poolfolder import remove_seat
 from application.models.account import Account
 from application.models.user import User
-from application.modules.checkmk.models import CheckmkFolderPool
+from application.models.cron import CronStats
+from application.modules.checkmk.models import CheckmkFolderPool, CheckmkObjectCache
+from application.modules.log.models import LogEntry
 from application.models.config import Config
 from application.helpers.cron import register_cronjob
 
@@ -62,12 +64,12 @@ def cli_maintenance(days):
 def delete_cache():
     """
     Delete object Cache
+
+    Normally not needed, since changed rules invalidate the cache
+    of the affected plugin automatically.
     """
     print(f"{ColorCodes.HEADER} ***** Delete Cache ***** {ColorCodes.ENDC}")
-    for host in Host.objects():
-        logger.debug(f"Handling Host {host.hostname}")
-        host.cache = {}
-        host.save()
+    Host.objects().update(set__cache={})
     print(f"{ColorCodes.OKGREEN}  ** {ColorCodes.ENDC}Done")
 
 #.
@@ -103,12 +105,70 @@ def reset_folder_pools():
             pool.folder_seats_taken = 0
             pool.save()
 
-        for host in Host.objects():
-            host.folder = None
-            host.save()
+        Host.objects(folder__ne=None).update(unset__folder=True)
     else:
         print(f"{ColorCodes.OKGREEN}  ** {ColorCodes.ENDC}Aborted")
 
+#.
+#   .-- Command: Ensure Indexes
+def _describe_plan(plan):
+    """
+    Return the Stages of a winning Query Plan as String
+    """
+    stages = []
+    while plan:
+        stage = plan['stage']
+        if 'indexName' in plan:
+            stage += f"({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get('inputStage')
+    return " <- ".join(stages)
+
+def ensure_indexes(explain=False):
+    """
+    Create and Report the Indexes of all Models
+    """
+    #pylint: disable=protected-access
+    print(f"{ColorCodes.HEADER} ***** Ensure Indexes ***** {ColorCodes.ENDC}")
+    for model in [Host, LogEntry, CronStats, CheckmkObjectCache, CheckmkFolderPool]:
+        model.ensure_indexes()
+        collection = model._get_collection()
+        for index in getattr(model, 'extra_indexes', []):
+            collection.create_index(index['keys'], name=index['name'])
+        print(f"{ColorCodes.UNDERLINE}{model.__name__}{ColorCodes.ENDC}")
+        for name, info in collection.index_information().items():
+            keys = ", ".join(f"{x}:{y}" for x, y in info['key'])
+            print(f"{ColorCodes.OKGREEN}  ** {ColorCodes.ENDC}{name} ({keys})")
+
+    if not explain:
+        return
+    print(f"{ColorCodes.HEADER} ***** Query Plans ***** {ColorCodes.ENDC}")
+    queries = {
+        'Export: available Hosts': {'available': True},
+        'Import: Hosts of Account': {'available': True, 'source_account_id': ''},
+        'Maintenance: not seen Hosts': {'last_import_seen': {'$lte': datetime.datetime.now()}},
+        'Folder Pools: locked Hosts': {'folder': 'pool'},
+        'Host View: Label exists': {'labels.example': {'$exists': True}},
+        'Host by Name': {'hostname': ''},
+    }
+    collection = Host._get_collection()
+    for name, query in queries.items():
+        plan = collection.find(query).explain()['queryPlanner']['winningPlan']
+        # Newer MongoDB versions wrap the plan
+        plan = plan.get('queryPlan', plan)
+        print(f"{ColorCodes.OKGREEN}  ** {ColorCodes.ENDC}{name}: {_describe_plan(plan)}")
+
+@_cli_sys.command('ensure_indexes')
+@click.option("--explain", is_flag=True)
+def cli_ensure_indexes(explain):
+    """
+    Create missing Indexes and show all Indexes
+
+    Args:
+        explain (bool): Print Query Plans of the main Queries
+    """
+    ensure_indexes(explain)
+
 #.
 #   .-- Command: Show Accounts
 @_cli_sys.command('show_accounts')
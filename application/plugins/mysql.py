@@ -2,7 +2,7 @@
 """Import Mysql Data"""
 import click
 from application import app
-from application.models.host import Host
+from application.modules.importer import HostImporter
 from application.helpers.get_account import get_account_by_name
 from application.modules.debug import ColorCodes
 from application.helpers.cron import register_cronjob
@@ -31,22 +31,14 @@ def mysql_import(account):
     mycursor.execute(f"SELECT {config['fields']} FROM {config['table']};")
     all_hosts = mycursor.fetchall()
     field_names = config['fields'].split(',')
+    importer = HostImporter(account_dict=config)
     for line in all_hosts:
+        labels = dict(zip(field_names, line))
         hostname = labels['host_hostname'].strip().lower()
         print(f" {ColorCodes.OKGREEN}* {ColorCodes.ENDC} Check {hostname}")
-        labels = dict(zip(field_names, line))
         del labels['host_hostname']
-
-        host_obj = Host.get_host(hostname)
-        host_obj.set_import_seen()
-        if host_obj.get_labels() == labels:
-            host_obj.set_import_sync()
-            host_obj.set_labels(labels)
-        if host_obj.set_account(account_dict=config):
-            print(f" {ColorCodes.OKGREEN} * {ColorCodes.ENDC} Updated Labels")
-            host_obj.save()
-            continue
-        print(f" {ColorCodes.WARNING} * {ColorCodes.ENDC} Managed by diffrent master")
+        importer.add(hostname, labels)
+    importer.finish()
 
 @cli_mysql.command('import_hosts')
 @click.argument('account')
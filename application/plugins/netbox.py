@@ -42,7 +42,7 @@ def cli_netbox():
 
 
 #   .-- Command: Export Hosts
-def netbox_host_export(account, debug):
+def netbox_host_export(account, debug=False, limit=None):
     """Sync Objects with Netbox"""
     try:
         target_config = get_account_by_name(account)
@@ -53,7 +53,7 @@ def netbox_host_export(account, debug):
             syncer.rewrite = rules['rewrite']
             syncer.actions = rules['actions']
             syncer.config = target_config
-            syncer.export_hosts()
+            syncer.export_hosts(limit)
         else:
             print(f"{ColorCodes.FAIL} Target not found {ColorCodes.ENDC}")
     except Exception as error_obj: #pylint: disable=broad-except
@@ -62,9 +62,18 @@ def netbox_host_export(account, debug):
 @cli_netbox.command('export_hosts')
 @click.argument("account")
 @click.option("-d", "--debug", default=False, is_flag=True)
-def cli_netbox_host_export(account, debug):
-    """Sync Objects with Netbox"""
-    netbox_host_export(account, debug)
+@click.option("--limit", default='')
+def cli_netbox_host_export(account, debug, limit):
+    """
+    Sync Objects with Netbox
+
+    Args:
+        account (string): Name Account Config
+        debug (bool): Debug Output
+        limit (list): Comma separted list of Hosts
+    """
+    limit_list = [x.strip() for x in limit.split(',') if x]
+    netbox_host_export(account, debug, limit_list)
 #.
 #   .-- Command: Import Hosts
 def netbox_host_import(account):
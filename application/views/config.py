@@ -23,10 +23,10 @@ class ConfigModelView(DefaultModelView):
     def commit_changes(self):
         """
         Delete all Caches
+        Rule changes invalidate the cache anyway,
+        so this only forces a full rebuild.
         """
-        for host in Host.objects():
-            host.cache = {}
-            host.save()
+        Host.objects().update(set__cache={})
         flash("Cache deleted")
         return redirect(f"{app.config['BASE_PREFIX']}admin")
 